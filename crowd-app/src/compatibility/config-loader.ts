@@ -9,6 +9,7 @@ import { TrainingConfig } from '../models/training-config';
 
 import { convertRawEmails } from '../models/email';
 import { convertRawCommitments } from '../models/commitment';
+import { unpackIndex } from '../components/smart/search-engine';
 
 const createDelayedPromise = <T>(item:any, delay:number):Promise<T> => {
   if (delay === 0) {
@@ -21,6 +22,45 @@ const createDelayedPromise = <T>(item:any, delay:number):Promise<T> => {
   });
 }
 
+// Prefix of deflated configs, see build_tasks.py --compress
+const COMPRESSED_MARKER = 'HZ1:';
+
+const decodeConfig = async (encoded:string):Promise<any> => {
+  const payload = atob(encoded);
+  if (!payload.startsWith(COMPRESSED_MARKER)) {
+    return JSON.parse(payload);
+  }
+  const bytes = new Uint8Array(payload.length - COMPRESSED_MARKER.length);
+  for (let i = 0; i < bytes.length; i++) {
+    bytes[i] = payload.charCodeAt(i + COMPRESSED_MARKER.length);
+  }
+  // The payload is a zlib stream, which DecompressionStream calls 'deflate'
+  const inflated = (new Response(bytes).body as any).pipeThrough(
+    new (window as any).DecompressionStream('deflate'));
+  return new Response(inflated).json();
+}
+
+// Resolves v2 configs, where sessions refer to a shared message table by key,
+// back into sessions that carry their own messages
+const resolveMessageTable = (data:any):object[] => {
+  if (data['version'] !== 2) {
+    return data['sessions'];
+  }
+  const table = data['messages'];
+  return data['sessions'].map((def:any) => {
+    if (typeof def !== 'object' || !Array.isArray(def['messages'])) {
+      return def;
+    }
+    const { read, ...rest } = def;
+    return {
+      ...rest,
+      'messages': def['messages'].map((ref:string, i:number) => {
+        return {'id': ref, ...table[ref], 'read': read[i]};
+      })
+    };
+  });
+}
+
 export default class ConfigLoader {
   private loadSession(def:any, index:number):Session<any> {
     const type = 'type' in def ? def['type'] : '',
@@ -40,6 +80,8 @@ export default class ConfigLoader {
           'isStable': 'isStable' in def ? def['isStable'] === 'true' : true,
           'promoted': def['promoted'],
           'index': def['index'],
+          'searchIndex': 'searchIndex' in def ?
+            unpackIndex(def['searchIndex']) : undefined,
           'messages': convertRawEmails(def['messages'])
         });
       } else if (def['task'] === 'compose') {
@@ -128,7 +170,7 @@ export default class ConfigLoader {
       if (!('sessions' in data) || !Array.isArray(data['sessions'])) {
         throw new Error('Data illegal! Must be an array of sessions!');
       } else {
-        return this.createSessionsFromDef(data['sessions']);
+        return this.createSessionsFromDef(resolveMessageTable(data));
       }
     });
   }
@@ -138,11 +180,12 @@ export default class ConfigLoader {
       return Promise.reject(new Error('DOM element not found'));
     }
     try {
-      const data = JSON.parse(atob(dom.innerHTML.trim()));
+      const data = await decodeConfig(dom.innerHTML.trim());
       if (!('sessions' in data) || !Array.isArray(data['sessions'])) {
         throw new Error('Data illegal! Must be an array of sessions!');
       } else {
-        return createDelayedPromise(this.createSessionsFromDef(data['sessions']), 0);
+        return createDelayedPromise(
+          this.createSessionsFromDef(resolveMessageTable(data)), 0);
       }
     } catch (e) {
       return Promise.reject(e);
@@ -11,6 +11,12 @@ interface IndexRecord {
 };
 export type SearchIndex = {[token:string]:IndexRecord[]};
 export type AugmentedIndex = {[token:string]:string[]};
+// Index precomputed by build_tasks.py --search-index. Postings are flat
+// [documentId, count, ...] lists and token sizes are stored once per document
+export type PackedSearchIndex = {
+  sizes:number[];
+  postings:{[token:string]:number[]};
+};
 
 interface IndexConfig {
   indexMaxNgram:number; // Set to
@@ -95,6 +101,22 @@ const buildIndex = (messages:Email[],
   return index;
 }
 
+export const unpackIndex = (packed:PackedSearchIndex):SearchIndex => {
+  const index:SearchIndex = {};
+  for (let key in packed.postings) {
+    const postings = packed.postings[key], records:IndexRecord[] = [];
+    for (let i = 0; i < postings.length; i += 2) {
+      records.push({
+        documentId: postings[i],
+        count: postings[i + 1],
+        size: packed.sizes[postings[i]]
+      });
+    }
+    index[key] = records;
+  }
+  return index;
+}
+
 export interface SearchEngine {
   search(query:string, quick?:boolean):{searched:boolean, results:number[]};
   createHighlighter(query:string):Highlighter;
@@ -276,14 +298,20 @@ export class SimpleSearchEngine extends BaseHighlighter implements SearchEngine
   private readonly _index:SearchIndex;
   private readonly _sort:boolean;
 
-  constructor(messages:Email[], sort:boolean = true, index?:AugmentedIndex) {
+  constructor(messages:Email[], sort:boolean = true, index?:AugmentedIndex,
+    searchIndex?:SearchIndex) {
     super();
     this._messages = messages;
-    this._index = buildIndex(this._messages);
+    this._index = searchIndex ? {...searchIndex} : buildIndex(this._messages);
     this._sort = sort;
     // augment the index
     if (index) {
       for (let keyword in index) {
+        if (searchIndex &&
+          Object.prototype.hasOwnProperty.call(searchIndex, keyword)) {
+          // Leave the shared precomputed records untouched
+          this._index[keyword] = searchIndex[keyword].slice();
+        }
         index[keyword].forEach((id) => {
           if (!(keyword in this._index)) {
             this._index[keyword] = [];
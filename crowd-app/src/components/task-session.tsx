@@ -181,7 +181,8 @@ export default class TaskSession extends React.Component<Props, State> {
       const searchTask = task as SearchTaskConfig;
       let engine:SearchEngine = searchTask.perfMode === 'baseline' ?
         new RegexSearchEngine(searchTask.messages) :
-        new SimpleSearchEngine(searchTask.messages, true, searchTask.index);
+        new SimpleSearchEngine(searchTask.messages, true, searchTask.index,
+          searchTask.searchIndex);
       const reversed:boolean = searchTask.perfMode !== 'full';
       this._instConfig.set('stable', searchTask.isStable);
       this._instConfig.set('performance', searchTask.perfMode);
@@ -18,6 +18,9 @@ interface SimplifiedToken {
   p?:TokenType;
   t:string;
 }
+// Compact bodies list each paragraph's lines as plain strings
+type RawParagraph = SimplifiedToken[] | string[];
+
 interface RawEmail {
   id: string;
   from: Address;
@@ -25,8 +28,9 @@ interface RawEmail {
   cc: Address[];
   bcc: Address[];
   time: string;
+  timestamp?: number|null;
   subject: string;
-  body: SimplifiedToken[][];
+  body: RawParagraph[];
   read: boolean;
 }
 
@@ -99,26 +103,48 @@ export const createEmail = (id:string,
   };
 }
 
+const expandParagraph = (p:RawParagraph):Paragraph => {
+  return (p as (SimplifiedToken | string)[]).map((st, i):Token => {
+    if (typeof st === 'string') {
+      return {
+        'type': 'span',
+        'id': 's-' + i,
+        'text': st + '\n'
+      };
+    }
+    return {
+      'type': st.p ? st.p : 'span',
+      'id': st.id,
+      'text': st.t
+    };
+  });
+}
+
 export const convertRawEmails = (emails:RawEmail[]):Email[] => {
   return emails.map((email) => {
-    return {
+    // Bodies are only expanded once something reads them
+    let body:Paragraph[] | null = null;
+    const converted = {
       id: email.id,
       from: email.from,
       to: email.to,
       cc: email.cc,
       bcc: email.bcc,
-      time: new Date(email.time),
+      // Prefer the epoch seconds resolved at build time over parsing
+      time: typeof email.timestamp === 'number' ?
+        new Date(email.timestamp * 1000) : new Date(email.time),
       subject: email.subject,
-      read: email.read,
-      body: email.body.map((p) => {
-        return p.map((st) => {
-            return {
-            'type': st.p ? st.p : 'span',
-            'id': st.id,
-            'text': st.t
-          }
-        });
-      })
-    };
+      read: email.read
+    } as Email;
+    Object.defineProperty(converted, 'body', {
+      enumerable: true,
+      get: () => {
+        if (body === null) {
+          body = email.body.map(expandParagraph);
+        }
+        return body;
+      }
+    });
+    return converted;
   })
 }
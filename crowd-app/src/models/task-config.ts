@@ -2,7 +2,8 @@ import { Email } from './email';
 import { CommitmentMap } from './commitment';
 
 import { InboxAction } from '../components/ui/inbox';
-import { AugmentedIndex } from '../components/smart/search-engine';
+import { AugmentedIndex,
+  SearchIndex } from '../components/smart/search-engine';
 
 export type TaskType = 'search' | 'compose' | 'commitment';
 
@@ -22,6 +23,7 @@ interface InboxTaskConfig extends TaskConfig {
 export interface SearchTaskConfig extends InboxTaskConfig {
   systemName:'Smart Search';
   index?:AugmentedIndex;
+  searchIndex?:SearchIndex;
   promoted?:string[];
   isStable:boolean;
 }
@@ -9,6 +9,7 @@ export interface Series extends SubSeries {
   raw?:string;
   error_x?:number[];
   error_y?:number[];
+  ci?:number[][];
   name?:string;
   desc?:string|string[];
   type?:'markers-only'|'trendline';
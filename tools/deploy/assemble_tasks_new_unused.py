@@ -2,6 +2,7 @@ import os
 from os.path import join, dirname, abspath
 import tools.mailtools
 from tools import mailtools, MDConfig, MDSection
+from tools.mailarchive import open_maildir
 import datetime
 
 from constants import MAILDIR
@@ -11,22 +12,16 @@ Load a mailbox and generate the new task definitions
 """
 def load_mail(user):
   # Sanity check that the directories exist
-  inboxdir = os.path.join(MAILDIR, user, 'inbox')
-  if not os.path.isdir(inboxdir):
-    raise Exception(f'Cannot find directory {inboxdir}!')
+  maildir = open_maildir(MAILDIR)
+  inboxdir = '/'.join([user, 'inbox'])
+  if not maildir.isdir(inboxdir):
+    raise Exception(f'Cannot find directory {os.path.join(MAILDIR, inboxdir)}!')
+  # Binning only needs the dates, so skip reading the bodies
   emails = []
-  for mail in os.listdir(inboxdir):
-    mailfile = os.path.join(inboxdir, mail)
-    if not os.path.isfile(mailfile):
+  for message in mailtools.scan_mailbox(maildir, inboxdir):
+    if message.date is None:
+      print(f'[Err] Read {message.id} failed with: no date')
       continue
-    id = '/'.join([user, 'inbox', mail])
-    message = None
-    with open(mailfile, 'r') as f:
-      try:
-        message = mailtools.load_email(id, f)
-      except Exception as e:
-        print(f'[Err] Read {id} failed with: {e}')
-        continue
     emails.append(message)
   return emails
 
@@ -47,7 +42,7 @@ def week_to_day(y, w, d):
 def bin_emails_by_week(mails):
   bins = {}
   for message in mails:
-    yc, mc, dc = message.getDate()[:3]
+    yc, mc, dc = message.date[:3]
     y, w, d = find_canonical_week(yc, mc, dc)
     weekbin = (y, w)#f'{y}-W{w:02}'
     if not weekbin in bins:
@@ -155,7 +150,7 @@ if __name__ == '__main__':
       f'Tag emails concerning event commitments between the dates {first_day} and {last_day}.'
     ])
     task.set('messages', [
-      'raw-list: ' + ','.join([msg.getId() for msg in bin])
+      'raw-list: ' + ','.join([msg.id for msg in bin])
     ])
     document.addSection(task)
 
@@ -1,14 +1,48 @@
 import os
-import quopri
 import re
 import json
 import random
 import math
+import zlib
 
-from dateutil.parser import parse
-from os.path import join, dirname, abspath, isdir, isfile
+from base64 import b64encode
+from concurrent.futures import ProcessPoolExecutor
+from os.path import join, dirname, abspath, isdir, isfile, basename
 
-from constants import MAILDIR
+from constants import MAILDIR, MAILCACHE, MAILINDEX
+from tools.mailcache import MailCache, DEFAULT_MAX_SIZE
+from tools.mailarchive import open_maildir
+from tools.mailindex import MailIndex
+from tools import mailtools, searchindex, fastjson
+
+# Prefixed to deflated configs before base64 so readers can tell them apart
+# from plain JSON, which always starts with '{'
+COMPRESSED_MARKER = b'HZ1:'
+CSV_HEADER = b'CONFIG\n'
+
+# Parsed mail cache shared by buildMessages, see configureCache
+_mailCache = None
+
+def configureCache(filename, maxSize = DEFAULT_MAX_SIZE):
+  global _mailCache
+  if not _mailCache is None:
+    _mailCache.close()
+  _mailCache = None if filename is None else MailCache(filename, maxSize)
+  return _mailCache
+
+# Maildir metadata index used by findMail, see configureIndex
+_mailIndex = None
+
+def configureIndex(filename):
+  global _mailIndex
+  if not _mailIndex is None:
+    _mailIndex.close()
+  _mailIndex = None if filename is None else MailIndex(filename)
+  return _mailIndex
+
+def _initWorker(cache, cacheSize, index):
+  configureCache(cache, cacheSize)
+  configureIndex(index)
 
 def cleanName(name):
   name = re.sub(r'\s*<.+?>$', '', name)
@@ -26,7 +60,8 @@ def extractPeople(headers, field = 'to'):
     ]
   return []
 
-def parseEmail(id, headers, body, read = True, limitPeople = None):
+def parseEmail(id, headers, paragraphs, read = True, limitPeople = None,
+  timestamp = None):
   toField = extractPeople(headers, 'to')
   ccField = extractPeople(headers, 'cc')
   bccField = extractPeople(headers, 'bcc')
@@ -36,25 +71,6 @@ def parseEmail(id, headers, body, read = True, limitPeople = None):
     ccField = ccField[:limitPeople]
     bccField = bccField[:limitPeople]
 
-  # Construct the body
-  paragraphs, currentP = [], None
-  for line in body:
-    if currentP is None:
-      currentP = []
-    if len(line.strip()) == 0:
-      if len(currentP) > 0:
-        # Push the current paragraph in
-        paragraphs.append(currentP)
-        currentP = None
-    else:
-      currentP.append({
-        'id': f's-{len(currentP)}',
-        't': line.strip() + '\n'
-      })
-  if not currentP is None and len(currentP) > 0:
-    paragraphs.append(currentP)
-    currentP = None
-
   email = {
     'id': id,
     'subject': headers['subject'] if 'subject' in headers else '(No subject)',
@@ -66,65 +82,56 @@ def parseEmail(id, headers, body, read = True, limitPeople = None):
     'cc': ccField,
     'bcc': bccField,
     'time': headers['date'],
+    'timestamp': timestamp,
     'read': read,
-    'body': paragraphs
+    'body': buildBody(paragraphs)
   }
   return email
 
-def readEmail(filename):
-  with open(filename, 'r') as f:
-    headers = {}
-    lastHeader = None
-    body = None
-    inferredEncoding = None
-    try:
-      for line in f:
-        line = line.strip()
-        if len(line) == 0 and body is None:
-          body = []
-          # Infer encoding
-          if not 'content-type' in headers:
-            inferredEncoding = 'utf-8'
-          else:
-            bits = [p.lower().strip()
-              for p in headers['content-type'].split(';', 1)]
-            encodings = [enc
-              for enc in bits if enc.startswith('charset=')]
-            if len(encodings) > 0:
-              inferredEncoding = encodings[0][8:].strip()
-            else:
-              inferredEncoding = 'utf-8'
-        if body is None:
-          # is a header
-          if ':' in line:
-            key, value = line.split(':', 1)
-            headers[key.lower()] = value.strip();
-            lastHeader = key.lower()
-          else:
-            headers[lastHeader] += ' ' + line;
-        else:
-          # is a body line
-          try:
-            body.append(quopri.decodestring(line).decode(inferredEncoding))
-          except Exception as e:
-            pass
-    except UnicodeDecodeError as e:
-      print(e)
-      print(filename)
-    return headers, body
+def buildBody(paragraphs):
+  return [[{'id': f's-{i}', 't': line + '\n'} for i, line in enumerate(p)]
+    for p in paragraphs]
+
+def readEmail(path):
+  with open_maildir(MAILDIR).open(path, 'rb') as f:
+    return mailtools.read_message(f)
+
+def loadEmail(path):
+  """
+  Reads a mail file into a record of headers, body paragraphs and resolved
+  date, going through the mail cache when one is configured.
+  """
+  if not _mailCache is None:
+    key = join(MAILDIR, path)
+    stat = open_maildir(MAILDIR).stat(path)
+    record = _mailCache.get(key, stat.st_size, stat.st_mtime_ns)
+    if not record is None:
+      return record
+  headers, body = readEmail(path)
+  record = {
+    'headers': headers,
+    'body': mailtools.split_paragraphs(body),
+    'date': mailtools.resolve_date(headers.get('date'))
+  }
+  if not _mailCache is None:
+    _mailCache.put(key, stat.st_size, stat.st_mtime_ns, record)
+  return record
 
 def findMail(path, rangeMin = None, rangeMax = None):
   # Sanity check that the directories exist
-  targetdir = join(MAILDIR, path)
-  if isfile(targetdir):
+  maildir = open_maildir(MAILDIR)
+  if maildir.isfile(path):
     return ['']
 
-  if not isdir(targetdir):
-    raise Exception(f'Cannot find directory {targetdir}!')
+  if not maildir.isdir(path):
+    raise Exception(f'Cannot find directory {join(MAILDIR, path)}!')
 
-  mail = sorted([mail
-      for mail in os.listdir(targetdir) if isfile(join(targetdir, mail))],
-    key=lambda n: int(n[:-1]))
+  if not _mailIndex is None:
+    mail = _mailIndex.listFolder(path)
+  else:
+    mail = sorted([mail
+        for mail in maildir.listdir(path) if maildir.isfile(join(path, mail))],
+      key=lambda n: int(n[:-1]))
   if not rangeMin is None:
     if not rangeMax is None:
       mail = mail[rangeMin:rangeMax]
@@ -136,16 +143,42 @@ def findMail(path, rangeMin = None, rangeMax = None):
 
   return mail
 
-def _applyParams(mail, params):
+def _applyParams(mail, params, rng = random):
   params = set(params)
   if 'some-unread' in params:
-    if random.random() > 0.8:
+    if rng.random() > 0.8:
       mail['read'] = False
   if 'all-unread' in params:
     mail['read'] = False
   return mail
 
-def buildMessages(cfgStr):
+def _reductionParams(cfgStr):
+  """
+  Reads the body reduction options of a message source, e.g.
+  `arnold-j/inbox @ 0~100 : all-unread; strip-quotes; max-chars=2000`.
+  """
+  src, params = [t.strip() for t in cfgStr.split(':', 1)]
+  reduction = {}
+  if src == 'raw-list':
+    return reduction
+  for param in params.split(';'):
+    key, _, value = [t.strip() for t in param.partition('=')]
+    if key in ('strip-quotes', 'strip-signature', 'reduce-gold'):
+      reduction[key] = True
+    elif key in ('max-paragraphs', 'max-chars'):
+      reduction[key] = int(value)
+  return reduction
+
+def reduceMessage(message, reduction):
+  paragraphs = [[span['t'][:-1] for span in p] for p in message['body']]
+  message['body'] = buildBody(mailtools.reduce_body(paragraphs,
+    stripQuotes = reduction.get('strip-quotes', False),
+    stripSignature = reduction.get('strip-signature', False),
+    maxParagraphs = reduction.get('max-paragraphs'),
+    maxChars = reduction.get('max-chars')))
+  return message
+
+def buildMessages(cfgStr, rng = random):
   src, params = [t.strip() for t in cfgStr.split(':', 1)]
   if src == 'raw-list':
     for p in params.split(','):
@@ -153,10 +186,10 @@ def buildMessages(cfgStr):
       if len(id) == 0:
         continue
 
-      path = join(MAILDIR, id)
       try:
-        headers, body = readEmail(path)
-        mail = parseEmail(id, headers, body, limitPeople = 5)
+        record = loadEmail(id)
+        mail = parseEmail(id, record['headers'], record['body'],
+          limitPeople = 5, timestamp = record['date'])
         mail['read'] = False
         yield mail
       except Exception:
@@ -171,11 +204,12 @@ def buildMessages(cfgStr):
         rangeMax = int(rMax) if len(rMax) != 0 else None
     mailFiles = findMail(src, rangeMin, rangeMax)
     for mailFile in mailFiles:
-      path = join(MAILDIR, src, mailFile)
-      headers, body = readEmail(path)
-      mail = parseEmail(src + '/' + mailFile, headers, body, limitPeople = 5)
+      record = loadEmail(join(src, mailFile))
+      mail = parseEmail(src + '/' + mailFile, record['headers'], record['body'],
+        limitPeople = 5, timestamp = record['date'])
       # Apply params
-      mail = _applyParams(mail, [p.strip() for p in params.split(';') if len(p.strip()) > 0])
+      mail = _applyParams(mail,
+        [p.strip() for p in params.split(';') if len(p.strip()) > 0], rng)
       yield mail
 
 def buildIndex(cfgStr, prevIndex):
@@ -193,11 +227,18 @@ def tagCommitments(cfgStr, prevCommitments):
   }
   return prevCommitments
 
-def buildFromConfig(filename):
+def specRandom(filename, seed):
+  """
+  Creates the RNG for a single spec. It only depends on the spec file name and
+  the global seed, so specs build the same no matter which process runs them.
+  """
+  return random.Random(f'{seed}:{basename(filename)}')
+
+def buildFromConfig(filename, rng = random):
   """
   Parses a config file that's loosely reminiscent of a markdown file.
   """
-  taskSpec = []
+  taskSpec, reductions = [], []
   with open(filename, 'r') as f:
     currentSession, lastKey = None, None
     for line in f:
@@ -238,8 +279,11 @@ def buildFromConfig(filename):
         if lastKey is None:
           raise Exception('Format error, key lost!')
         if key == 'messages':
-          for message in buildMessages(line[1:].strip()):
+          reduction = _reductionParams(line[1:].strip())
+          for message in buildMessages(line[1:].strip(), rng):
             currentSession[key].append(message)
+            if len(reduction) > 0:
+              reductions.append((currentSession, message, reduction))
         elif key == 'promoted':
           currentSession[key].append(line[1:].strip())
         elif key == 'actions':
@@ -273,17 +317,113 @@ def buildFromConfig(filename):
         currentSession[lastKey] += '\r\n' + value.strip()
   if not currentSession is None:
     taskSpec.append(currentSession)
+  # Gold messages are listed after the messages, so bodies are reduced last
+  for session, message, reduction in reductions:
+    gold = set(session.get('promoted', [])) | set(session.get('commitments', {}))
+    if not message['id'] in gold or reduction.get('reduce-gold', False):
+      reduceMessage(message, reduction)
   for spec in taskSpec:
     if 'messages' in spec:
       spec['messages'] = sorted(spec['messages'],
-        key=lambda m: parse(m['time']),
+        key=lambda m: m['timestamp'] or 0,
         reverse=True)
   # Post processing
   return {'sessions': taskSpec}
 
+def packMessageTable(spec):
+  """
+  Converts a spec into the v2 config format: every email is stored once in a
+  top-level message table and sessions refer to it by key, keeping only the
+  per-session read status. Table keys double as email ids unless an entry
+  carries its own.
+  """
+  table = {}
+  for session in spec['sessions']:
+    if not 'messages' in session:
+      continue
+    refs, read = [], []
+    for message in session['messages']:
+      entry = {k: v for k, v in message.items() if k != 'read' and k != 'id'}
+      # Emails that differ between sessions get their own table entry
+      ref, variant = message['id'], 1
+      while ref in table and table[ref] != entry:
+        variant += 1
+        ref = f'{message["id"]}#{variant}'
+        entry['id'] = message['id']
+      table[ref] = entry
+      refs.append(ref)
+      read.append(message['read'])
+    session['messages'] = refs
+    session['read'] = read
+  return {'version': 2, 'messages': table, 'sessions': spec['sessions']}
+
+def encodeSpec(spec, compress = False):
+  # Base64 bytes of the spec. Uncompressed payloads are read with atob, so
+  # they must stay ASCII
+  payload = fastjson.dumps(spec, ascii=not compress)
+  if compress:
+    payload = COMPRESSED_MARKER + zlib.compress(payload, 9)
+  return b64encode(payload)
+
+def packRows(sizes, maxFileSize = None):
+  """
+  Packs CSV rows of the given byte sizes into as few files as fit under
+  maxFileSize (first fit decreasing, counting the header and line breaks).
+  Returns a list of files, each a list of row indices kept in input order.
+  """
+  budget = math.inf if maxFileSize is None else maxFileSize - len(CSV_HEADER)
+  files, free = [], []
+  for i in sorted(range(len(sizes)), key=lambda i: -sizes[i]):
+    size = sizes[i] + 1
+    if size > budget:
+      raise ValueError(f'Row {i} ({size} bytes) exceeds the file budget')
+    for f, room in enumerate(free):
+      if size <= room:
+        files[f].append(i)
+        free[f] -= size
+        break
+    else:
+      files.append([i])
+      free.append(budget - size)
+  return sorted([sorted(rows) for rows in files])
+
+def groupFilename(outfile, i):
+  outsrc = outfile.split('.')
+  return '.'.join(['.'.join(outsrc[:-1]) + f'-{i}'] + outsrc[-1:])
+
+def compactBodies(spec):
+  """
+  Switches message bodies to the compact encoding: paragraphs are plain lists
+  of lines, span ids are implied by position and line breaks are dropped.
+  """
+  for session in spec['sessions']:
+    for message in session.get('messages', []):
+      message['body'] = [[span['t'][:-1] for span in p] for p in message['body']]
+  return spec
+
+def indexSearchSessions(spec):
+  """
+  Precomputes the app's search index for every search task session.
+  """
+  for session in spec['sessions']:
+    if session.get('task') == 'search' and 'messages' in session:
+      session['searchIndex'] = searchindex.pack_index(
+        *searchindex.build_index(session['messages']))
+  return spec
+
+def _buildSpec(job):
+  filename, seed, options = job
+  spec = buildFromConfig(filename, specRandom(filename, seed))
+  if options['searchIndex']:
+    spec = indexSearchSessions(spec)
+  if options['compact']:
+    spec = compactBodies(spec)
+  if options['version'] == 2:
+    spec = packMessageTable(spec)
+  return basename(filename), spec
+
 if __name__ == '__main__':
   import argparse
-  from base64 import b64encode
   parser = argparse.ArgumentParser(description='Build a task descriptor json file.')
   parser.add_argument('config', action='store',
             help='Configuration file or directory to read')
@@ -293,56 +433,127 @@ if __name__ == '__main__':
             default = False, help='Base64 encode output')
   parser.add_argument('-c', '--csv', dest='csv', action='store_true',
             default = False, help='Assemble into CSV file')
+  parser.add_argument('-z', '--compress', dest='compress', action='store_true',
+            default = False, help='Deflate configs before base64 encoding')
   parser.add_argument('-g', '--group', dest='groups', action='store',
             type=int, default=1, help='How many groups? (Default 1)' )
+  parser.add_argument('--max-row-size', dest='maxRowSize', action='store',
+            type=int, default=None, help='Reject configs over N KB when encoded')
+  parser.add_argument('--max-file-size', dest='maxFileSize', action='store',
+            type=int, default=None,
+            help='Pack configs into as many CSV files of at most N KB as needed')
+  parser.add_argument('-f', '--format', dest='version', action='store',
+            type=int, choices=(1, 2), default=2,
+            help='Config format, 2 stores each email once (Default 2)')
+  parser.add_argument('--compact-body', dest='compact', action='store_true',
+            default=False, help='Encode email bodies as lists of lines')
+  parser.add_argument('--search-index', dest='searchIndex', action='store_true',
+            default=False, help='Precompute the index of search sessions')
+  parser.add_argument('-j', '--jobs', dest='jobs', action='store',
+            type=int, default=1, help='Build specs in N processes (Default 1)')
+  parser.add_argument('-s', '--seed', dest='seed', action='store',
+            type=int, default=None, help='Seed for randomized message params')
+  parser.add_argument('--no-index', dest='index', action='store_const',
+            const=None, default=MAILINDEX if isfile(MAILINDEX) else None,
+            help='List mail folders from the maildir instead of mailindex.db')
+  parser.add_argument('--cache', dest='cache', action='store',
+            default=MAILCACHE, help='Parsed mail cache file (Default mailcache.db)')
+  parser.add_argument('--cache-size', dest='cacheSize', action='store',
+            type=int, default=DEFAULT_MAX_SIZE // (1024 * 1024),
+            help='Mail cache size cap in MB (Default 512)')
+  parser.add_argument('--no-cache', dest='cache', action='store_const',
+            const=None, help='Do not use the parsed mail cache')
   args = parser.parse_args()
 
+  cacheSize = args.cacheSize * 1024 * 1024
+  _initWorker(args.cache, cacheSize, args.index)
+  seed = args.seed if not args.seed is None else random.randrange(2 ** 32)
+  options = {
+    'version': args.version,
+    'compact': args.compact,
+    'searchIndex': args.searchIndex
+  }
+
   if isdir(args.config):
-    specs = [(fn, buildFromConfig(join(args.config, fn)))
-      for fn in os.listdir(args.config) if isfile(join(args.config, fn))]
+    print(f'Using seed {seed}')
+    jobs = [(join(args.config, fn), seed, options)
+      for fn in sorted(os.listdir(args.config)) if isfile(join(args.config, fn))]
+    if args.jobs > 1:
+      with ProcessPoolExecutor(args.jobs, initializer=_initWorker,
+        initargs=(args.cache, cacheSize, args.index)) as pool:
+        specs = list(pool.map(_buildSpec, jobs,
+          chunksize=max(1, len(jobs) // (args.jobs * 4))))
+    else:
+      specs = [_buildSpec(job) for job in jobs]
     print(f'Read {len(specs)} inputs')
-    if args.csv:
+    if args.csv and (args.maxRowSize or args.maxFileSize):
+      if args.groups > 1:
+        parser.error('--group cannot be combined with size budgets')
+      rows = [encodeSpec(spec, args.compress) for fn, spec in specs]
+      # A row must also fit into an otherwise empty file
+      budgets = []
+      if args.maxRowSize:
+        budgets.append(args.maxRowSize * 1024)
+      if args.maxFileSize:
+        budgets.append(args.maxFileSize * 1024 - len(CSV_HEADER) - 1)
+      rowBudget = min(budgets)
+      oversize = [f'{fn} ({len(row) // 1024} KB)'
+        for (fn, _), row in zip(specs, rows) if len(row) > rowBudget]
+      if len(oversize) > 0:
+        parser.error('Configs over the row budget: ' + ', '.join(oversize))
+      files = packRows([len(row) for row in rows],
+        args.maxFileSize * 1024 if args.maxFileSize else None)
+      print(f' - Packing into {len(files)} file(s) with ' +
+        ', '.join(str(len(group)) for group in files) + ' records')
+      manifest = []
+      for i, group in enumerate(files):
+        outfile = args.outfile if len(files) == 1 else groupFilename(args.outfile, i)
+        with open(outfile, 'wb') as f:
+          f.write(CSV_HEADER)
+          for row, j in enumerate(group):
+            f.write(rows[j] + b'\n')
+            manifest.append({'spec': specs[j][0], 'file': basename(outfile),
+              'row': row, 'size': len(rows[j])})
+      with open('.'.join(args.outfile.split('.')[:-1]) + '-manifest.json', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    elif args.csv:
       groupsize = math.floor(len(specs) / args.groups)
       assert groupsize * args.groups == len(specs)
       if groupsize < len(specs):
         print(f' - Generating {args.groups} file(s) with {groupsize} records each')
         for i in range(0, args.groups):
-          outsrc = args.outfile.split('.')
-          outfile = '.'.join(['.'.join(outsrc[:-1]) + f'-{i}'] + outsrc[-1:])
-          with open(outfile, 'w') as f:
-            f.write('CONFIG\n')
+          with open(groupFilename(args.outfile, i), 'wb') as f:
+            f.write(CSV_HEADER)
             for fn, spec in specs[i * groupsize: (i + 1) * groupsize]:
-              specSerialized = json.dumps(spec)
-              encoded = b64encode(specSerialized.encode('utf-8')).decode('utf-8')
-              f.write(f'{encoded}\n')
+              f.write(encodeSpec(spec, args.compress) + b'\n')
       else:
-        with open(args.outfile, 'w') as f:
-          f.write('CONFIG\n')
+        with open(args.outfile, 'wb') as f:
+          f.write(CSV_HEADER)
           for fn, spec in specs:
-            specSerialized = json.dumps(spec)
-            encoded = b64encode(specSerialized.encode('utf-8')).decode('utf-8')
-            f.write(f'{encoded}\n')
+            f.write(encodeSpec(spec, args.compress) + b'\n')
     else:
       # Not csv out? Let's create things in place
       if not isdir(args.outfile):
         raise Error('Output must be directory unless csv specified')
       for fn, spec in specs:
-        specSerialized = json.dumps(spec)
-        with open(join(args.outfile, '.'.join(fn.split('.')[:-1]) + '.json'), 'w') as f:
-          if args.b64encode:
-            encoded = b64encode(specSerialized.encode('utf-8')).decode('utf-8')
-            f.write(encoded)
+        with open(join(args.outfile, '.'.join(fn.split('.')[:-1]) + '.json'), 'wb') as f:
+          if args.b64encode or args.compress:
+            f.write(encodeSpec(spec, args.compress))
           else:
-            f.write(specSerialized)
+            f.write(fastjson.dumps(spec))
   elif isfile(args.config):
-    spec = buildFromConfig(args.config)
-    specSerialized = json.dumps(spec)
-    if args.b64encode:
-      specSerialized = b64encode(specSerialized.encode('utf-8')).decode('utf-8')
+    _, spec = _buildSpec((args.config, seed, options))
+    if args.b64encode or args.compress:
+      specSerialized = encodeSpec(spec, args.compress)
+    else:
+      specSerialized = fastjson.dumps(spec)
     if args.outfile is None:
       print(spec)
     else:
-      with open(args.outfile, 'w') as f:
+      with open(args.outfile, 'wb') as f:
         if args.csv:
-          f.write('CONFIG\n')
+          f.write(CSV_HEADER)
         f.write(specSerialized)
+
+  # Flush pending cache bookkeeping
+  _initWorker(None, 0, None)
@@ -1,3 +1,8 @@
-from os.path import join, dirname, abspath
-
-MAILDIR = join(dirname(abspath(__file__)), 'maildir')
\ No newline at end of file
+import os
+from os.path import join, dirname, abspath
+
+# Either the maildir tree or an archive built with pack_maildir.py
+MAILDIR = os.environ.get('HINT_MAILDIR',
+  join(dirname(abspath(__file__)), 'maildir'))
+MAILCACHE = join(dirname(abspath(__file__)), 'mailcache.db')
+MAILINDEX = join(dirname(abspath(__file__)), 'mailindex.db')
@@ -0,0 +1,27 @@
+"""
+Usage: Builds or incrementally updates the SQLite metadata index of the maildir
+
+subsample_mail.py and build_tasks.py answer their queries from the index when
+it exists. Re-run this after the maildir changes; only new or modified
+messages are parsed again.
+"""
+import sys
+
+from constants import MAILDIR, MAILINDEX
+from tools.mailarchive import open_maildir
+from tools.mailindex import MailIndex
+
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser(description='Index the maildir metadata.')
+  parser.add_argument('maildir', action='store', nargs='?', default=MAILDIR,
+            help='Maildir or archive to index (Default ./maildir)')
+  parser.add_argument('-o', '--out', dest='outfile', action='store',
+            default=MAILINDEX, help='Index file (Default ./mailindex.db)')
+  args = parser.parse_args()
+
+  index = MailIndex(args.outfile)
+  added, removed = index.update(open_maildir(args.maildir),
+    progress = lambda n: print(f' - Indexed {n} messages', file=sys.stderr))
+  index.close()
+  print(f'Indexed {added} new or changed and dropped {removed} removed messages')
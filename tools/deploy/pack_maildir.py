@@ -0,0 +1,25 @@
+"""
+Usage: Packs the Enron maildir into a single archive file
+
+Point HINT_MAILDIR at the resulting archive to have the other tools read mail
+out of it instead of the maildir tree.
+"""
+import sys
+from os.path import join, dirname, abspath
+
+from constants import MAILDIR
+from tools.mailarchive import pack
+
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser(description='Pack the maildir into an archive.')
+  parser.add_argument('maildir', action='store', nargs='?', default=MAILDIR,
+            help='Maildir to pack (Default ./maildir)')
+  parser.add_argument('-o', '--out', dest='outfile', action='store',
+            default=join(dirname(abspath(__file__)), 'maildir.pack'),
+            help='Output archive (Default ./maildir.pack)')
+  args = parser.parse_args()
+
+  count = pack(args.maildir, args.outfile,
+    progress = lambda n: print(f' - Packed {n} files', file=sys.stderr))
+  print(f'Packed {count} files into {args.outfile}')
@@ -0,0 +1,164 @@
+"""
+Simulates the event suggestions each participant gets in commitment sessions.
+Mirrors CommitmentEngineWrapper.train in
+crowd-app/src/components/smart/commitment-engine.ts and the perfMode handling
+in task-session.tsx, drawing the app's shuffle for many participants at once.
+"""
+import math
+import numpy as np
+
+from os.path import join, isdir, isfile, basename
+
+from constants import MAILCACHE, MAILINDEX
+from build_tasks import buildFromConfig, specRandom, configureCache, \
+  configureIndex
+
+# perfMode prefix -> (precTarget, recallTarget) passed to train
+TRAIN_TARGETS = (
+  ('stable', (0.8, 0.8)),
+  ('variable-high', (1, 1)),
+  ('variable-low', (0.6, 0.6))
+)
+
+def sessionPerfMode(session, usePerfMode = None):
+  # Same fallbacks as the config loader. usePerfMode stands in for sessions
+  # that only say `usePerf: true`
+  if 'perfMode' in session:
+    return session['perfMode']
+  if session.get('isBaseline') == 'true':
+    return 'baseline'
+  if not usePerfMode is None and session.get('usePerf') == 'true':
+    return usePerfMode
+  return 'standard'
+
+def trainTargets(perfMode):
+  for prefix, targets in TRAIN_TARGETS:
+    if perfMode.startswith(prefix):
+      return targets
+  return None
+
+def trainCounts(positives, precTarget, recallTarget):
+  """
+  Number of positive and negative suggestions train picks, with the app's
+  rounding (Math.round, and a loop that runs while i < neg).
+  """
+  pos = math.floor(recallTarget * positives + 0.5)
+  neg = pos * (1 - precTarget) / precTarget
+  return pos, math.ceil(neg)
+
+def shuffleDraws(n, draws, rng):
+  """
+  Runs the app's shuffle on range(n) once per draw. It picks j from [0, i)
+  rather than [0, i], so it only produces cyclic permutations.
+  """
+  order = np.tile(np.arange(n), (draws, 1))
+  rows = np.arange(draws)
+  for i in range(n - 1, 0, -1):
+    j = np.floor(rng.random(draws) * i).astype(int)
+    swapped = order[rows, j]
+    order[rows, j] = order[:, i]
+    order[:, i] = swapped
+  return order
+
+def simulateSession(session, perfMode, draws, window, rng):
+  """
+  Suggestions for one commitment session. Returns None when the session gets
+  no suggestions. Otherwise returns the full inbox counts and, per draw, the
+  suggestion count, precision and recall among the first `window` messages.
+  """
+  targets = trainTargets(perfMode)
+  if targets is None:
+    return None
+  gold = set(session.get('commitments', {}))
+  isGold = np.array([m['id'] in gold for m in session['messages']], dtype=bool)
+  positive, negative = np.flatnonzero(isGold), np.flatnonzero(~isGold)
+  pos, neg = trainCounts(len(positive), *targets)
+  result = {
+    'messages': len(isGold),
+    'gold': len(positive),
+    'suggested': pos + neg,
+    'precision': pos / (pos + neg) if pos + neg > 0 else math.nan,
+    'recall': pos / len(positive) if len(positive) > 0 else math.nan,
+    # train reads past the end of the negatives and the session breaks
+    'feasible': neg <= len(negative)
+  }
+  if not result['feasible']:
+    return result
+  picked = np.concatenate([
+    positive[shuffleDraws(len(positive), draws, rng)[:, :pos]],
+    negative[shuffleDraws(len(negative), draws, rng)[:, :neg]]], axis=1)
+  shown = picked < window
+  shownPositive = (shown & isGold[picked]).sum(axis=1)
+  count = shown.sum(axis=1)
+  with np.errstate(invalid='ignore', divide='ignore'):
+    result['window'] = {
+      'suggested': count,
+      'precision': shownPositive / count,
+      'recall': shownPositive / isGold[:window].sum()
+    }
+  return result
+
+def _spread(values):
+  values = values[~np.isnan(values)] if values.dtype.kind == 'f' else values
+  if len(values) == 0:
+    return '-'
+  p5, p50, p95 = np.percentile(values, [5, 50, 95])
+  return f'{p50:.2f} [{p5:.2f}, {p95:.2f}]'
+
+if __name__ == '__main__':
+  import argparse, os
+  parser = argparse.ArgumentParser(
+    description='Simulate the event suggestions of commitment sessions.')
+  parser.add_argument('config', action='store',
+            help='Spec file or directory of specs to read')
+  parser.add_argument('-d', '--draws', dest='draws', action='store',
+            type=int, default=10000, help='Participants to simulate (Default 10000)')
+  parser.add_argument('-w', '--window', dest='window', action='store',
+            type=int, default=None,
+            help='Only count the first N messages of each inbox (Default all)')
+  parser.add_argument('-p', '--perf-mode', dest='perfMode', action='store',
+            default=None, help='perfMode assumed for sessions with usePerf: true')
+  parser.add_argument('-s', '--seed', dest='seed', action='store',
+            type=int, default=None, help='Seed for the simulation')
+  args = parser.parse_args()
+
+  configureCache(MAILCACHE)
+  configureIndex(MAILINDEX if isfile(MAILINDEX) else None)
+  rng = np.random.default_rng(args.seed)
+
+  if isdir(args.config):
+    files = [join(args.config, fn) for fn in sorted(os.listdir(args.config))
+      if fn.endswith('.md')]
+  else:
+    files = [args.config]
+
+  infeasible = 0
+  print('spec\tsession\tperfMode\tmessages\tgold\tsuggested\tprecision\trecall' +
+    '\twindow suggested\twindow precision\twindow recall')
+  for filename in files:
+    spec = buildFromConfig(filename, specRandom(filename, 0))
+    for session in spec['sessions']:
+      if session.get('task') != 'commitment' or not 'messages' in session:
+        continue
+      perfMode = sessionPerfMode(session, args.perfMode)
+      window = args.window if not args.window is None else len(session['messages'])
+      result = simulateSession(session, perfMode, args.draws, window, rng)
+      row = [basename(filename), session['name'], perfMode]
+      if result is None:
+        print('\t'.join(row + ['no suggestions']))
+        continue
+      row += [str(result['messages']), str(result['gold']),
+        str(result['suggested']), f'{result["precision"]:.2f}',
+        f'{result["recall"]:.2f}']
+      if not result['feasible']:
+        infeasible += 1
+        print('\t'.join(row + ['NOT ENOUGH NEGATIVES']))
+        continue
+      print('\t'.join(row + [_spread(result['window'][k])
+        for k in ('suggested', 'precision', 'recall')]))
+
+  configureCache(None)
+  configureIndex(None)
+  if infeasible > 0:
+    print(f'{infeasible} session(s) cannot reach their targets')
+    exit(1)
@@ -8,36 +8,38 @@ import os
 import sys
 from os.path import join, dirname, abspath
 
-from constants import MAILDIR
+from constants import MAILDIR, MAILINDEX
 from tools import mailtools
+from tools.mailarchive import open_maildir
+from tools.mailindex import MailIndex
 
 def find_maiboxes(targetDir = MAILDIR, inboxSize = 350):
   """find_maiboxes
   Finds all mail relative to the path
 
-  @param targetDir - target directory to scan
+  @param targetDir - target maildir directory or archive to scan
   @param inboxMinCutoff - minimum inbox size reqired to include a user
   """
+  maildir = open_maildir(targetDir)
   # Sanity check that the directories exist
-  if not os.path.isdir(targetDir):
+  if not maildir.isdir(''):
     raise Exception(f'Cannot find directory {targetDir}!')
 
   people = {}
-  for dirname in os.listdir(targetDir):
-    userdir = os.path.join(targetDir, dirname)
-    if not os.path.isdir(userdir):
+  for dirname in maildir.listdir(''):
+    if not maildir.isdir(dirname):
       continue
-    inboxdir = os.path.join(userdir, 'inbox')
-    if not os.path.isdir(inboxdir):
+    inboxdir = '/'.join([dirname, 'inbox'])
+    if not maildir.isdir(inboxdir):
       continue
     emails = []
-    for mail in os.listdir(inboxdir):
-      mailfile = os.path.join(inboxdir, mail)
-      if not os.path.isfile(mailfile):
+    for mail in maildir.listdir(inboxdir):
+      id = '/'.join([inboxdir, mail])
+      if not maildir.isfile(id):
         continue
       emails.append({
-        'id': '/'.join([dirname, 'inbox', mail]),
-        'path': mailfile
+        'id': id,
+        'maildir': targetDir
       })
     if len(emails) >= inboxSize:
       people[dirname] = emails
@@ -47,18 +49,17 @@ def find_maiboxes(targetDir = MAILDIR, inboxSize = 350):
 def filter_mails(mails):
   bins = {}
   for mail in mails:
-    with open(mail['path'], 'r') as f:
+    with open_maildir(mail['maildir']).open(mail['id'], 'rb') as f:
       try:
-        message = mailtools.load_email(mail['id'], f)
+        message = mailtools.scan_headers(mail['id'], f)
       except Exception as e:
         print(f'Failed[{mail["id"]}] - {e}', file=sys.stderr)
         continue
-      date = message.getDate()
-      if date is not None:
-        bin = f'{date[0]}-{date[1]:02}'
+      if message.date is not None:
+        bin = f'{message.date[0]}-{message.date[1]:02}'
         if not bin in bins:
           bins[bin] = []
-        bins[bin].append(message)
+        bins[bin].append(message.id)
   return bins
 
 if __name__ == '__main__':
@@ -68,13 +69,25 @@ if __name__ == '__main__':
     limit = [x.strip() for x in sys.argv[1].split(',')]
   mode = sys.argv[2] if len(sys.argv) > 2 else 'summary'
 
-  people = find_maiboxes()
-  for person in people:
+  # Answer from the metadata index when it has been built
+  index = MailIndex(MAILINDEX) if os.path.isfile(MAILINDEX) else None
+  if index is None:
+    people = find_maiboxes()
+    sizes = {person: len(people[person]) for person in people}
+  else:
+    sizes = index.mailboxes('inbox', 350)
+
+  def binMonthly(person):
+    if index is None:
+      return filter_mails(people[person])
+    return index.monthly(person)
+
+  for person in sizes:
     if limit is None or person in limit:
       if mode == 'summary':
-        print(f'{person} = {len(people[person])}')
+        print(f'{person} = {sizes[person]}')
       elif mode == 'monthly':
-        binned = filter_mails(people[person])
+        binned = binMonthly(person)
         cur_mc, max_mc = 0, 0
         for bin in sorted(binned.keys(), reverse=True):
           num_mails = len(binned[bin])
@@ -98,7 +111,7 @@ if __name__ == '__main__':
         print(f'Usable months: {max_mc}')
         print('')
       elif mode == 'sample-monthly':
-        binned = filter_mails(people[person])
+        binned = binMonthly(person)
         current_pool, current_months, task_id = [], [], 0
         for bin in sorted(binned.keys()):
           current_pool.extend(binned[bin])
@@ -133,7 +146,7 @@ if __name__ == '__main__':
             print(f'> Tag emails concerning event commitments in the months {", ".join(current_months)}\n')
             print('systemName: Event Detector\n')
             print('messages:')
-            print('- raw-list:' + ','.join([msg.id for msg in current_pool]))
+            print('- raw-list:' + ','.join(current_pool))
             print('')
 
             current_pool = []
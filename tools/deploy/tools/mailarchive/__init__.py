@@ -0,0 +1,162 @@
+"""mailarchive
+Packs the enron maildir into a single memory-mapped archive file and gives
+the archive and the plain directory tree a common read interface
+"""
+import io
+import json
+import mmap
+import os
+import posixpath
+import struct
+from collections import namedtuple
+from functools import lru_cache
+
+MAGIC = b'HINTMAIL'
+VERSION = 1
+# magic, version, index offset, index length
+HEADER = struct.Struct('<8sIQQ')
+
+MailStat = namedtuple('MailStat', ['st_size', 'st_mtime_ns'])
+
+def _normalize(path):
+  path = posixpath.normpath(path.replace(os.sep, '/')).strip('/')
+  return '' if path == '.' else path
+
+def pack(maildir, filename, progress = None):
+  """pack
+  Packs every file below maildir into a single archive
+
+  @param maildir - root of the maildir to pack
+  @param filename - archive file to write
+  @param progress - optional callback receiving the number of packed files
+  """
+  if not os.path.isdir(maildir):
+    raise Exception(f'Cannot find directory {maildir}!')
+  files = []
+  with open(filename, 'wb') as out:
+    out.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+    for root, dirs, names in os.walk(maildir):
+      dirs.sort()
+      relroot = _normalize(os.path.relpath(root, maildir))
+      for name in sorted(names):
+        with open(os.path.join(root, name), 'rb') as f:
+          data = f.read()
+        files.append((posixpath.join(relroot, name), out.tell(), len(data)))
+        out.write(data)
+        if not progress is None and len(files) % 10000 == 0:
+          progress(len(files))
+    indexOffset = out.tell()
+    index = json.dumps({'files': files}).encode('utf-8')
+    out.write(index)
+    out.seek(0)
+    out.write(HEADER.pack(MAGIC, VERSION, indexOffset, len(index)))
+  return len(files)
+
+class MailDirectory:
+  """Reads mail straight from a maildir tree"""
+  def __init__(self, root):
+    self.root = root
+
+  def _path(self, path):
+    return os.path.join(self.root, _normalize(path))
+
+  def isfile(self, path):
+    return os.path.isfile(self._path(path))
+
+  def isdir(self, path):
+    return os.path.isdir(self._path(path))
+
+  def listdir(self, path = ''):
+    return os.listdir(self._path(path))
+
+  def stat(self, path):
+    stat = os.stat(self._path(path))
+    return MailStat(stat.st_size, stat.st_mtime_ns)
+
+  def read(self, path):
+    with open(self._path(path), 'rb') as f:
+      return f.read()
+
+  def open(self, path, mode = 'r'):
+    if mode == 'rb':
+      return open(self._path(path), 'rb')
+    return open(self._path(path), 'r', encoding = 'utf-8')
+
+class MailArchive:
+  """Reads mail from an archive written by pack. The archive is memory
+  mapped and read hands out zero-copy slices of it."""
+  def __init__(self, filename):
+    self.filename = filename
+    self._file = open(filename, 'rb')
+    self._map = mmap.mmap(self._file.fileno(), 0, access = mmap.ACCESS_READ)
+    self._view = memoryview(self._map)
+    magic, version, indexOffset, indexLength = HEADER.unpack_from(self._map)
+    if magic != MAGIC or version != VERSION:
+      raise Exception(f'{filename} is not a mail archive!')
+    index = json.loads(
+      bytes(self._view[indexOffset:indexOffset + indexLength]))
+    self._mtime = os.fstat(self._file.fileno()).st_mtime_ns
+    self._files, self._dirs = {}, {'': []}
+    for path, offset, length in index['files']:
+      self._files[path] = (offset, length)
+      # Register the file with all of its parent directories
+      child = path
+      parent = posixpath.dirname(child)
+      while True:
+        if parent in self._dirs:
+          self._dirs[parent].append(posixpath.basename(child))
+          break
+        self._dirs[parent] = [posixpath.basename(child)]
+        child, parent = parent, posixpath.dirname(parent)
+
+  def isfile(self, path):
+    return _normalize(path) in self._files
+
+  def isdir(self, path):
+    return _normalize(path) in self._dirs
+
+  def listdir(self, path = ''):
+    path = _normalize(path)
+    if not path in self._dirs:
+      raise FileNotFoundError(f'No directory {path} in {self.filename}')
+    return list(self._dirs[path])
+
+  def stat(self, path):
+    offset, length = self._entry(path)
+    return MailStat(length, self._mtime)
+
+  def _entry(self, path):
+    path = _normalize(path)
+    if not path in self._files:
+      raise FileNotFoundError(f'No file {path} in {self.filename}')
+    return self._files[path]
+
+  def read(self, path):
+    offset, length = self._entry(path)
+    return self._view[offset:offset + length]
+
+  def open(self, path, mode = 'r'):
+    raw = io.BytesIO(self.read(path))
+    if mode == 'rb':
+      return raw
+    return io.TextIOWrapper(raw, encoding = 'utf-8')
+
+def walk_files(maildir, path = ''):
+  """walk_files
+  Yields the paths of all files below path in a maildir or archive
+  """
+  for name in sorted(maildir.listdir(path)):
+    child = posixpath.join(path, name)
+    if maildir.isdir(child):
+      yield from walk_files(maildir, child)
+    elif maildir.isfile(child):
+      yield child
+
+@lru_cache(maxsize = None)
+def open_maildir(location):
+  """open_maildir
+  Opens either a maildir tree or a packed archive, depending on location
+  """
+  if os.path.isfile(location):
+    return MailArchive(location)
+  return MailDirectory(location)
@@ -0,0 +1,89 @@
+"""mailcache
+Persistent on-disk cache of parsed enron emails
+"""
+import json
+import sqlite3
+import time
+
+# Bump whenever the layout of cached records changes
+CACHE_VERSION = 3
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+
+class MailCache:
+  """LRU cache of parsed mail records backed by a SQLite file.
+
+  Records are keyed by the mail path together with its size and mtime so a
+  changed file is simply re-parsed. Once the stored payloads grow past
+  maxSize bytes, the least recently used records are evicted.
+  """
+  def __init__(self, filename, maxSize = DEFAULT_MAX_SIZE):
+    self.maxSize = maxSize
+    self._conn = sqlite3.connect(filename, timeout = 60,
+      isolation_level = None)
+    self._conn.execute('PRAGMA journal_mode=WAL')
+    self._conn.execute('PRAGMA synchronous=NORMAL')
+    self._conn.execute('CREATE TABLE IF NOT EXISTS meta ' +
+      '(key TEXT PRIMARY KEY, value TEXT)')
+    self._conn.execute('CREATE TABLE IF NOT EXISTS mail (' +
+      'path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, ' +
+      'used REAL, bytes INTEGER, record TEXT)')
+    self._conn.execute('CREATE INDEX IF NOT EXISTS mail_used ON mail (used)')
+    version = self._conn.execute(
+      'SELECT value FROM meta WHERE key = ?', ('version',)).fetchone()
+    if version is None or int(version[0]) != CACHE_VERSION:
+      self._conn.execute('DELETE FROM mail')
+      self._conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+        ('version', str(CACHE_VERSION)))
+    self._total = self._conn.execute(
+      'SELECT COALESCE(SUM(bytes), 0) FROM mail').fetchone()[0]
+    self._touched = {}
+
+  def get(self, path, size, mtime):
+    row = self._conn.execute(
+      'SELECT record FROM mail WHERE path = ? AND size = ? AND mtime = ?',
+      (path, size, mtime)).fetchone()
+    if row is None:
+      return None
+    self._touched[path] = time.time()
+    if len(self._touched) >= 256:
+      self.flush()
+    return json.loads(row[0])
+
+  def put(self, path, size, mtime, record):
+    payload = json.dumps(record)
+    old = self._conn.execute('SELECT bytes FROM mail WHERE path = ?',
+      (path,)).fetchone()
+    self._conn.execute('INSERT OR REPLACE INTO mail VALUES (?, ?, ?, ?, ?, ?)',
+      (path, size, mtime, time.time(), len(payload), payload))
+    self._total += len(payload) - (old[0] if old is not None else 0)
+    if self._total > self.maxSize:
+      self.evict()
+
+  def evict(self):
+    """Drops least recently used records until the cache is under 90% of
+    its size cap"""
+    self.flush()
+    # Other processes may share the file, so start from the real total
+    self._total = self._conn.execute(
+      'SELECT COALESCE(SUM(bytes), 0) FROM mail').fetchone()[0]
+    target = self.maxSize * 0.9
+    if self._total <= target:
+      return
+    dropped = []
+    for path, size in self._conn.execute(
+      'SELECT path, bytes FROM mail ORDER BY used ASC'):
+      if self._total <= target:
+        break
+      dropped.append((path,))
+      self._total -= size
+    self._conn.executemany('DELETE FROM mail WHERE path = ?', dropped)
+
+  def flush(self):
+    if len(self._touched) > 0:
+      self._conn.executemany('UPDATE mail SET used = ? WHERE path = ?',
+        [(used, path) for path, used in self._touched.items()])
+      self._touched = {}
+
+  def close(self):
+    self.flush()
+    self._conn.close()
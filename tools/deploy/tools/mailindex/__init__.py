@@ -0,0 +1,106 @@
+"""mailindex
+SQLite metadata index over the enron maildir
+"""
+import re
+import sqlite3
+from email.utils import parsedate_tz, mktime_tz
+
+from tools.mailarchive import walk_files
+from tools.mailtools import scan_header_fields
+
+INDEX_FIELDS = ('date', 'from', 'subject', 'to', 'cc', 'bcc')
+
+SCHEMA = [
+  'CREATE TABLE IF NOT EXISTS messages (' +
+    'id TEXT PRIMARY KEY, user TEXT, folder TEXT, file TEXT, ' +
+    'file_order INTEGER, date INTEGER, tz_offset INTEGER, sender TEXT, ' +
+    'subject TEXT, recipients INTEGER, body_size INTEGER, ' +
+    'size INTEGER, mtime INTEGER)',
+  'CREATE INDEX IF NOT EXISTS messages_order ' +
+    'ON messages (user, folder, file_order)',
+  'CREATE INDEX IF NOT EXISTS messages_date ON messages (user, folder, date)'
+]
+
+def _count_people(value):
+  return len([p for p in value.split(',') if len(p.strip()) > 0])
+
+def read_metadata(id, file, size):
+  """read_metadata
+  Extracts the indexed fields from the headers of a message
+  """
+  headers, headerSize = scan_header_fields(file, INDEX_FIELDS)
+
+  date, offset = None, None
+  parsed = parsedate_tz(headers['date']) if 'date' in headers else None
+  if not parsed is None:
+    date, offset = mktime_tz(parsed), parsed[9] or 0
+
+  parts = id.split('/')
+  order = re.match(r'^(\d+)', parts[-1])
+  return (id, parts[0], '/'.join(parts[1:-1]), parts[-1],
+    int(order.group(1)) if order else None,
+    date, offset,
+    headers.get('from'),
+    headers.get('subject'),
+    sum(_count_people(headers.get(f, '')) for f in ('to', 'cc', 'bcc')),
+    size - headerSize)
+
+class MailIndex:
+  """Index of message metadata (user, folder, date, sender, ...) that lets
+  the deploy tools answer questions about the corpus without reparsing it"""
+  def __init__(self, filename):
+    self._conn = sqlite3.connect(filename)
+    for statement in SCHEMA:
+      self._conn.execute(statement)
+
+  def update(self, maildir, progress = None):
+    """Brings the index in sync with maildir, only parsing messages that
+    are new or have changed size or mtime since the last update"""
+    known = {id: (size, mtime) for id, size, mtime in
+      self._conn.execute('SELECT id, size, mtime FROM messages')}
+    added, seen = 0, set()
+    with self._conn:
+      for id in walk_files(maildir):
+        seen.add(id)
+        stat = maildir.stat(id)
+        if known.get(id) == (stat.st_size, stat.st_mtime_ns):
+          continue
+        with maildir.open(id, 'rb') as f:
+          record = read_metadata(id, f, stat.st_size)
+        self._conn.execute('INSERT OR REPLACE INTO messages ' +
+          'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+          record + (stat.st_size, stat.st_mtime_ns))
+        added += 1
+        if not progress is None and added % 10000 == 0:
+          progress(added)
+      removed = [(id,) for id in known if not id in seen]
+      self._conn.executemany('DELETE FROM messages WHERE id = ?', removed)
+    return added, len(removed)
+
+  def mailboxes(self, folder = 'inbox', minSize = 0):
+    """Sizes of every user's folder with at least minSize messages"""
+    return dict(self._conn.execute(
+      'SELECT user, COUNT(*) FROM messages WHERE folder = ? ' +
+      'GROUP BY user HAVING COUNT(*) >= ? ORDER BY user', (folder, minSize)))
+
+  def listFolder(self, path):
+    """File names in a user/folder path, in numeric file order"""
+    user, folder = (path.strip('/').split('/', 1) + [''])[:2]
+    return [name for name, in self._conn.execute(
+      'SELECT file FROM messages WHERE user = ? AND folder = ? ' +
+      'ORDER BY file_order, file', (user, folder))]
+
+  def monthly(self, user, folder = 'inbox'):
+    """Message ids binned by the YYYY-MM of their (sender local) date"""
+    bins = {}
+    for bin, id in self._conn.execute(
+      "SELECT strftime('%Y-%m', date + tz_offset, 'unixepoch'), id " +
+      'FROM messages WHERE user = ? AND folder = ? AND date IS NOT NULL ' +
+      'ORDER BY file_order, file', (user, folder)):
+      if not bin in bins:
+        bins[bin] = []
+      bins[bin].append(id)
+    return bins
+
+  def close(self):
+    self._conn.close()
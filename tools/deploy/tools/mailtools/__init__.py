@@ -1,11 +1,29 @@
 """mailtools
 Tools for reading enron emails
 """
+import base64
+import binascii
+import io
 import quopri
 import re
-from email.utils import parsedate
+from collections import namedtuple
+from email.utils import parsedate, parsedate_tz, mktime_tz
 import time
 
+try:
+  from dateutil.parser import parse as parse_date_fallback
+except ImportError:
+  parse_date_fallback = None
+
+SCAN_CHUNK = 64 * 1024
+SCAN_FIELDS = ('date', 'from', 'subject')
+MAX_BODY_SIZE = 1024 * 1024
+# Starts the quoted chain below a reply, e.g. '-----Original Message-----'
+ORIGINAL_MESSAGE = re.compile(r'^-+\s*Original Message\s*-+$', re.IGNORECASE)
+SIGNATURE_DELIMITER = '--'
+
+HeaderRecord = namedtuple('HeaderRecord', ['id', 'date', 'sender', 'subject'])
+
 def clean_name(name):
   name = re.sub(r'\s*<.+?>$', '', name)
   name = re.sub(r'"(.+?)".*?$', r'\1', name)
@@ -23,46 +41,222 @@ def extract_people(headers, field = 'to'):
       })
   return people
 
-def load_email(id, file):
-  headers, body = {}, []
-  headers_completed, last_header = False, None
-  for line in file:
-    if len(line.strip()) == 0:
-      headers_completed = True
+def _read_header_block(file, chunkSize = SCAN_CHUNK):
+  """Reads chunks until the blank line ending the headers. Returns the bytes
+  read, where the header block ends and where the body starts."""
+  block, end, size = b'', -1, 0
+  while end < 0:
+    chunk = file.read(chunkSize)
+    if not chunk:
+      break
+    if len(block) == 0 and chunk[:1] in (b'\n', b'\r'):
+      # No headers at all
+      block, end = chunk, 0
+      size = 2 if chunk[:2] == b'\r\n' else 1
+      break
+    # The separator may straddle the chunk boundary
+    start = max(0, len(block) - 3)
+    block += chunk
+    end = block.find(b'\n\n', start)
+    crlf = block.find(b'\r\n\r\n', start)
+    if crlf >= 0 and (end < 0 or crlf < end):
+      end, size = crlf, crlf + 4
+    elif end >= 0:
+      size = end + 2
+  if end < 0:
+    end = size = len(block)
+  return block, end, size
+
+def _parse_header_block(block, fields = None):
+  headers, last = {}, None
+  for line in block.decode('utf-8', 'replace').splitlines():
+    if len(line) == 0:
       continue
-    if headers_completed:
-      body.append(line)
+    if line[0].isspace():
+      if not last is None:
+        headers[last] += ' ' + line.strip()
+    elif ':' in line:
+      key, value = line.split(':', 1)
+      key = key.strip().lower()
+      last = key if fields is None or key in fields else None
+      if not last is None:
+        headers[key] = value.strip()
+  return headers
+
+def scan_header_fields(file, fields = SCAN_FIELDS, chunkSize = SCAN_CHUNK):
+  """scan_header_fields
+  Reads a binary mail file in large chunks only up to the blank line that
+  ends the headers and parses the requested header fields
+
+  @param file - mail file opened in binary mode
+  @param fields - lower case names of the headers to keep, None for all
+  @return (headers, header size in bytes)
+  """
+  block, end, size = _read_header_block(file, chunkSize)
+  return _parse_header_block(block[:end], fields), size
+
+def _content_type(headers):
+  parts = headers.get('content-type', 'text/plain').split(';')
+  params = {}
+  for param in parts[1:]:
+    if '=' in param:
+      key, value = param.split('=', 1)
+      params[key.strip().lower()] = value.strip().strip('"')
+  return parts[0].strip().lower(), params
+
+def _select_part(raw, boundary):
+  """Finds the first text/plain part of a multipart body"""
+  delimiter = b'--' + boundary.encode('utf-8')
+  for part in raw.split(delimiter)[1:]:
+    if part.startswith(b'--'):
+      # Closing delimiter
+      break
+    # Drop the rest of the delimiter line
+    part = part.split(b'\n', 1)[1] if b'\n' in part else b''
+    block, end, size = _read_header_block(io.BytesIO(part))
+    headers = _parse_header_block(block[:end])
+    ctype, params = _content_type(headers)
+    if ctype.startswith('multipart/') and 'boundary' in params:
+      nested = _select_part(part[size:], params['boundary'])
+      if not nested is None:
+        return nested
+    elif ctype == 'text/plain':
+      return headers, part[size:]
+  return None
+
+def decode_body(headers, raw):
+  """decode_body
+  Decodes a raw body in one pass according to its Content-Transfer-Encoding
+  and charset. Multipart bodies are reduced to their text/plain part.
+
+  @param headers - lower cased message headers
+  @param raw - undecoded body bytes
+  """
+  ctype, params = _content_type(headers)
+  if ctype.startswith('multipart/'):
+    part = _select_part(raw, params['boundary']) \
+      if 'boundary' in params else None
+    if part is None:
+      return ''
+    return decode_body(*part)
+
+  encoding = headers.get('content-transfer-encoding', '').strip().lower()
+  if encoding == 'quoted-printable':
+    raw = quopri.decodestring(raw)
+  elif encoding == 'base64':
+    try:
+      raw = base64.b64decode(raw)
+    except binascii.Error:
+      pass
+  try:
+    return raw.decode(params.get('charset', 'utf-8'), 'replace')
+  except LookupError:
+    return raw.decode('utf-8', 'replace')
+
+def read_message(file, maxBodySize = MAX_BODY_SIZE):
+  """read_message
+  Reads the headers and the decoded text body of a binary mail file. At most
+  maxBodySize bytes of the body are read.
+  """
+  block, end, size = _read_header_block(file)
+  raw = block[size:size + maxBodySize]
+  if len(raw) < maxBodySize:
+    raw += file.read(maxBodySize - len(raw))
+  headers = _parse_header_block(block[:end])
+  return headers, decode_body(headers, raw)
+
+def split_paragraphs(text):
+  """split_paragraphs
+  Groups the stripped, non-empty lines of a body into paragraphs
+  """
+  paragraphs, current = [], []
+  for line in text.splitlines():
+    line = line.strip()
+    if len(line) == 0:
+      if len(current) > 0:
+        paragraphs.append(current)
+        current = []
     else:
-      if ':' in line:
-        key, value = [x.strip() for x in line.split(':', 1)]
-        if not key in headers:
-          headers[key.lower()] = value
-        else:
-          headers[key.lower()] += ' ' + value
-        last_header = key.lower()
-      else:
-        headers[last_header] += ' ' + line.strip()
-
-  # Deal with body
-  encoding = 'utf-8'
-  if 'content-type' in headers:
-    parts = [part.lower().strip()
-      for part in headers['content-type'].split(';', 1)]
-    encodings = [enc
-      for enc in parts if enc.startswith('charset=')]
-    if len(encodings) > 0:
-      encoding = encodings[0][8:].strip()
-
-  # Quopri the body
-  if 'content-transfer-encoding' in headers and \
-    headers['content-transfer-encoding'] == 'quoted-printable':
+      current.append(line)
+  if len(current) > 0:
+    paragraphs.append(current)
+  return paragraphs
+
+def reduce_body(paragraphs, stripQuotes = False, stripSignature = False,
+  maxParagraphs = None, maxChars = None):
+  """reduce_body
+  Drops quoted replies and everything below an original message separator
+  (stripQuotes) or a signature delimiter (stripSignature) from the paragraphs
+  of split_paragraphs, then keeps at most maxParagraphs paragraphs and
+  maxChars characters. A line cut short by maxChars ends in '...'.
+  """
+  reduced, chars = [], 0
+  for p in paragraphs:
+    lines, done = [], False
+    for line in p:
+      if stripQuotes and ORIGINAL_MESSAGE.match(line):
+        done = True
+      elif stripSignature and line == SIGNATURE_DELIMITER:
+        done = True
+      elif maxChars is not None and chars + len(line) > maxChars:
+        if chars < maxChars:
+          lines.append(line[:maxChars - chars] + '...')
+        done = True
+      elif not (stripQuotes and line.startswith('>')):
+        lines.append(line)
+        chars += len(line)
+      if done:
+        break
+    if len(lines) > 0:
+      reduced.append(lines)
+    if done or (maxParagraphs is not None and len(reduced) >= maxParagraphs):
+      break
+  return reduced
 
+def resolve_date(value):
+  """resolve_date
+  Resolves a Date header into epoch seconds. RFC 2822 dates take the fast
+  path, anything else falls back to dateutil when it is installed.
+  """
+  if value is None:
+    return None
+  parsed = parsedate_tz(value)
+  if not parsed is None:
+    try:
+      return mktime_tz(parsed)
+    except (OverflowError, ValueError):
+      pass
+  if not parse_date_fallback is None:
     try:
-      body = [quopri.decodestring(l).decode(encoding) for l in body]
-    except Exception as e:
-      print(id)
-      print(e)
+      return int(parse_date_fallback(value).timestamp())
+    except (OverflowError, ValueError):
+      pass
+  return None
 
+def scan_headers(id, file):
+  """scan_headers
+  Header-only counterpart of load_email for when just the date, sender and
+  subject of a message are needed
+  """
+  headers, _ = scan_header_fields(file)
+  return HeaderRecord(id,
+    parsedate(headers['date']) if 'date' in headers else None,
+    headers.get('from'),
+    headers.get('subject'))
+
+def scan_mailbox(maildir, path):
+  """scan_mailbox
+  Scans the headers of every message in a maildir (or archive) folder
+  """
+  for name in sorted(maildir.listdir(path)):
+    id = '/'.join([path, name])
+    if not maildir.isfile(id):
+      continue
+    with maildir.open(id, 'rb') as f:
+      yield scan_headers(id, f)
+
+def load_email(id, file):
+  headers, body = read_message(file)
   return Email(id, headers, body)
 
 class Email:
@@ -91,26 +285,13 @@ class Email:
     return parsedate(self._headers['date'])
 
   def getBody(self):
-    paragraphs, current = [], None
-    for line in self._body:
-      if current is None:
-        current = []
-      if len(line.strip()) == 0:
-        if len(current) > 0:
-          # Push the current paragraph in
-          paragraphs.append(current)
-          current = None
-      else:
-        current.append({
-          'id': f's-{len(current)}',
-          't': line.strip() + '\n'
-        })
-    if not current is None and len(current) > 0:
-      paragraphs.append(current)
-    return paragraphs
+    return [
+      [{'id': f's-{i}', 't': line + '\n'} for i, line in enumerate(paragraph)]
+      for paragraph in split_paragraphs(self._body)
+    ]
 
   def getRawBody(self):
-    return ''.join(self._body)
+    return self._body
 
   def toPOJO(self):
     return {
@@ -0,0 +1,74 @@
+"""searchindex
+Port of buildIndex in crowd-app/src/components/smart/search-engine.ts, used to
+ship search task configs with a precomputed index
+"""
+import re
+
+TOKEN_SEPARATOR = re.compile(r'[^a-zA-Z0-9-]+')
+INDEX_MAX_NGRAM = 2
+ABBREV_MAX_NGRAM = 4
+# Keys that resolve to Object.prototype members in the browser and therefore
+# never get a record of their own
+SHADOWED_KEYS = frozenset(['constructor'])
+
+def tokenize(text):
+  return [t for t in TOKEN_SEPARATOR.split(text) if len(t.strip()) > 0]
+
+def ngram_tokens(tokens, maxNgram):
+  for ngram in range(maxNgram, 0, -1):
+    for i in range(0, len(tokens) - ngram + 1):
+      yield tokens[i:i + ngram]
+
+def body_text(body):
+  """body_text
+  Joins a message body the way the app does, for spans or compact lines
+  """
+  return ' '.join(' '.join(span if isinstance(span, str) else span['t']
+    for span in p) for p in body)
+
+def build_index(messages, indexMaxNgram = INDEX_MAX_NGRAM,
+  abbrevMaxNgram = ABBREV_MAX_NGRAM):
+  """build_index
+  Builds the search index of a list of config messages. Returns the token
+  size of every message and, per key, a list of [documentId, count] records
+  in the same key and record order as the app.
+  """
+  index, sizes = {}, []
+  maxNgram = max(indexMaxNgram, abbrevMaxNgram)
+  for documentId, message in enumerate(messages):
+    subjectTokens = tokenize(message['subject'] + ' ' +
+      message['from']['fullName'])
+    bodyTokens = tokenize(body_text(message['body']))
+    sizes.append(len(subjectTokens) * 2 + len(bodyTokens))
+    records = {}
+
+    def add(key, weight):
+      if key in SHADOWED_KEYS:
+        return
+      if not key in records:
+        records[key] = [documentId, 0]
+        index.setdefault(key, []).append(records[key])
+      records[key][1] += weight
+
+    for tokens, weight in ((subjectTokens, 2), (bodyTokens, 1)):
+      for t in ngram_tokens(tokens, maxNgram):
+        if len(t) <= indexMaxNgram:
+          add(' '.join(t).lower(), weight)
+        if len(t) <= abbrevMaxNgram and len(t) > 1:
+          # Abbreviations can only work with first-last both caps
+          if t[0][0] == t[0][0].upper() and t[-1][0] == t[-1][0].upper():
+            add(''.join(tok[0] for tok in t).lower(), weight)
+        if len(t) == 1 and t[0] == t[0].upper():
+          add(t[0], weight)
+  return sizes, index
+
+def pack_index(sizes, index):
+  """pack_index
+  Compact form of an index: per key a flat [documentId, count, ...] list,
+  with the token size of every document stored once
+  """
+  return {
+    'sizes': sizes,
+    'postings': {key: [v for record in records for v in record]
+      for key, records in index.items()}
+  }
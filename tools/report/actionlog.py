@@ -0,0 +1,202 @@
+"""actionlog
+Metrics over the action-log stream of a worker. The stream is wrapped in an
+EventTable and each registered reducer reads the columns it needs from it,
+decoded once and shared, so a new metric is a new reducer rather than another
+walk over the log.
+"""
+EVENT_COLUMNS = ('ns', 't', 'event', 'message', 'query', 'source')
+
+class EventTable():
+  """
+  Columns of an action-log stream (see EVENT_COLUMNS). message, query and
+  source come from each event's data and are None where it has no such field.
+  Columns are decoded as reducers ask for them, over every row or only the
+  rows of one event.
+  """
+  __slots__ = ('stream', 'columns', 'rowsByEvent')
+
+  def __init__(self, stream):
+    self.stream = stream
+    # The namespace and event columns and the rows of every event type come
+    # from one walk over the stream, the rest is decoded on demand
+    ns, events, self.rowsByEvent = [], [], {}
+    for i, item in enumerate(stream):
+      ns.append(item['ns'])
+      event = item['event']
+      events.append(event)
+      if event in self.rowsByEvent:
+        self.rowsByEvent[event].append(i)
+      else:
+        self.rowsByEvent[event] = [i]
+    self.columns = {'ns': ns, 'event': events}
+
+  def __len__(self):
+    return len(self.stream)
+
+  def rows(self, event):
+    # Row numbers of an event type
+    return self.rowsByEvent.get(event, [])
+
+  def column(self, name, event = None):
+    # A column over every row or only the rows of one event, in stream order
+    if name in self.columns:
+      values = self.columns[name]
+      return values if event is None else [values[i] for i in self.rows(event)]
+    items = self.stream if event is None else \
+      [self.stream[i] for i in self.rows(event)]
+    if name == 'ns' or name == 'event':
+      values = [item[name] for item in items]
+    elif name == 't':
+      values = [item.get('t') for item in items]
+    else:
+      values = [(item.get('data') or {}).get(name) for item in items]
+    if event is None:
+      self.columns[name] = values
+    return values
+
+  def previous(self, i):
+    # Row number of the event before row i in the same namespace, or None
+    ns = self.columns['ns']
+    for j in range(i - 1, -1, -1):
+      if ns[j] == ns[i]:
+        return j
+    return None
+
+  def namespaces(self):
+    # In order of first appearance
+    return list(dict.fromkeys(self.column('ns')))
+
+class Reducer():
+  """
+  Folds an EventTable into one output dict per namespace. init fills every
+  output first, then reduce gets the table and {namespace: output}. Reducers
+  keep no state between tables, so one instance serves every worker.
+  """
+  def init(self, out):
+    pass
+
+  def reduce(self, table, outputs):
+    pass
+
+class CountEvents(Reducer):
+  # Counts an event under `name`, leaving the key out until it occurs
+  def __init__(self, event, name):
+    self.event = event
+    self.name = name
+
+  def reduce(self, table, outputs):
+    selected = table.column('ns', self.event)
+    for ns in dict.fromkeys(selected):
+      outputs[ns][self.name] = selected.count(ns)
+
+class TaskTime(Reducer):
+  # Time of the (last) end event in seconds
+  def reduce(self, table, outputs):
+    for ns, t in zip(table.column('ns', 'end'), table.column('t', 'end')):
+      outputs[ns]['taskTime'] = t / 1000
+
+class TagSources(Reducer):
+  # Tag events in total and by source (user, ai, ...)
+  def init(self, out):
+    out['total'] = 0
+
+  def reduce(self, table, outputs):
+    # Few distinct pairs, so counting each one is cheaper than a Counter
+    pairs = list(zip(table.column('ns', 'tag-event'),
+      table.column('source', 'tag-event')))
+    for ns, source in dict.fromkeys(pairs):
+      if source == 'total' or source == 'reverted':
+        raise Exception('Illegal source name!')
+      count = pairs.count((ns, source))
+      outputs[ns]['total'] += count
+      outputs[ns][source] = count
+
+class Reverts(Reducer):
+  """
+  Status changes of messages that were changed before. The set of changed
+  messages is shared by all namespaces, as it always has been.
+  """
+  def __init__(self, event):
+    self.event = event
+
+  def init(self, out):
+    out['reverted'] = 0
+
+  def reduce(self, table, outputs):
+    changed = set()
+    for ns, message in zip(table.column('ns', self.event),
+      table.column('message', self.event)):
+      if message in changed:
+        outputs[ns]['reverted'] += 1
+      else:
+        changed.add(message)
+
+class QuerySessions(Reducer):
+  """
+  Final queries, search sessions and the query each view came from. Typing a
+  query one character at a time continues a session and only keeps the
+  longest prefix.
+  """
+  def init(self, out):
+    out['queries'] = set()
+    out['sessions'] = 0
+    out['views'] = []
+
+  def reduce(self, table, outputs):
+    ns, events, stream = table.column('ns'), table.column('event'), table.stream
+    lastQueries = {}
+    for i in sorted(table.rows('search-init') + table.rows('view-message')):
+      if events[i] == 'view-message':
+        outputs[ns[i]]['views'].append((lastQueries.get(ns[i], ''),
+          stream[i]['data']['message']))
+        continue
+      out, query = outputs[ns[i]], stream[i]['data']['query']
+      # Remove any 1-off substring queries
+      out['queries'].discard(query[:-1])
+      out['queries'].add(query)
+      # Namespaces mostly come in runs, so the previous row is usually it
+      j = i - 1 if i > 0 and ns[i - 1] == ns[i] else table.previous(i)
+      if j is None:
+        raise Exception('there should be events before search-init!')
+      if not (events[j] in ('search-init', 'search-resp') and
+        stream[j]['data']['query'] == query[:-1]):
+        out['sessions'] += 1
+        lastQueries[ns[i]] = query
+
+# Reducers by output, in the order they fill it
+REDUCERS = {
+  'log': [
+    TaskTime(),
+    CountEvents('flag', 'flag'),
+    CountEvents('tag-event', 'tag'),
+    CountEvents('view-message', 'view')
+  ],
+  'commitment': [
+    TagSources(),
+    Reverts('tag-status-change')
+  ],
+  'search': [
+    QuerySessions(),
+    Reverts('action-status-change')
+  ]
+}
+
+def registerReducer(output, reducer):
+  REDUCERS.setdefault(output, []).append(reducer)
+
+def reduceEvents(table, outputs):
+  """
+  Runs the reducers of the named outputs over an EventTable. Returns
+  {output: {namespace: dict}} with a dict for every namespace in the table.
+  """
+  namespaces = table.namespaces()
+  results = {}
+  for name in outputs:
+    reducers = REDUCERS[name]
+    results[name] = {ns: {} for ns in namespaces}
+    for out in results[name].values():
+      for reducer in reducers:
+        reducer.init(out)
+    for reducer in reducers:
+      reducer.reduce(table, results[name])
+  return results
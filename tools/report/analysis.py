@@ -1,4 +1,12 @@
-import csv, sys, base64, json
+import csv, sys, os, re, base64, json, zlib, hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from json.decoder import scanstring
+
+import numpy as np
+
+import actionlog
+import fastjson
 
 # Initialize environment for CSV reading
 maxInt = sys.maxsize
@@ -15,21 +23,146 @@ EXPERIMENTS = ['calibration-0',
   'experiment-1',
   'experiment-2',
   'experiment-3']
+# Marks deflated configs, see build_tasks.py --compress
+COMPRESSED_MARKER = b'HZ1:'
+# Answer.data stores the summaries read, by key prefix
+RESPONSE_KEYS = ('task-state-', 'config-', 'action-log', 'surveys')
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+_decoder = json.JSONDecoder()
 
-def readMturkCsv(filename):
-  with open(filename, 'r') as f:
-    reader = csv.reader(f)
-    head = None
-    for row in reader:
-      if head is None:
-        head = row
-      else:
-        if len(row) == 0:
-          continue
-        r = {}
-        for i, field in enumerate(head):
-          r[field] = row[i] if i < len(row) else None
-        yield r
+def _csvLines(f, position):
+  # Lines of a binary file for csv.reader, decoded as text mode would, keeping
+  # the byte offset of the next line in position[0]
+  for line in f:
+    position[0] += len(line)
+    yield line.decode('utf-8').replace('\r\n', '\n')
+
+def _projectRow(head, positions, row):
+  if positions is None:
+    return {field: row[i] if i < len(row) else None
+      for i, field in enumerate(head)}
+  return tuple(row[i] if not i is None and i < len(row) else None
+    for i in positions)
+
+def _columnPositions(head, columns):
+  if columns is None:
+    return None
+  return [head.index(c) if c in head else None for c in columns]
+
+def readMturkCsv(filename, columns = None, offsets = False):
+  """
+  Rows of an MTurk results CSV as dicts of every column or, given a list of
+  columns, as tuples of just those (None where a row is short). With offsets
+  set, yields (byte offset, row) pairs that readMturkRow can seek back to.
+  """
+  with open(filename, 'rb') as f:
+    position = [0]
+    reader = csv.reader(_csvLines(f, position))
+    head = next(reader, None)
+    if head is None:
+      return
+    positions = _columnPositions(head, columns)
+    while True:
+      offset = position[0]
+      row = next(reader, None)
+      if row is None:
+        return
+      if len(row) == 0:
+        continue
+      row = _projectRow(head, positions, row)
+      yield (offset, row) if offsets else row
+
+def readMturkRow(filename, offset, columns = None):
+  # The row readMturkCsv(filename, columns, offsets=True) found at offset
+  with open(filename, 'rb') as f:
+    head = next(csv.reader(_csvLines(f, [0])))
+    f.seek(offset)
+    row = next(csv.reader(_csvLines(f, [offset])))
+  return _projectRow(head, _columnPositions(head, columns), row)
+
+def loadResponse(value, keys = RESPONSE_KEYS):
+  """
+  Parses an Answer.data object one entry at a time, keeping only the entries
+  whose key starts with one of `keys`. Other stores of the app are dropped as
+  soon as they are read. With orjson the object is parsed in one go instead,
+  which is faster than walking it entry by entry.
+  """
+  if fastjson.BACKEND == 'orjson':
+    return {key: item for key, item in fastjson.loads(value).items()
+      if key.startswith(keys)}
+  i = WHITESPACE.match(value, 0).end()
+  if value[i:i + 1] != '{':
+    raise ValueError('Answer.data is not an object')
+  response = {}
+  i = WHITESPACE.match(value, i + 1).end()
+  if value[i:i + 1] == '}':
+    return response
+  while True:
+    if value[i:i + 1] != '"':
+      raise ValueError(f'Expected a key at {i} of Answer.data')
+    key, i = scanstring(value, i + 1)
+    i = WHITESPACE.match(value, i).end()
+    if value[i:i + 1] != ':':
+      raise ValueError(f'Expected \':\' at {i} of Answer.data')
+    item, i = _decoder.raw_decode(value, WHITESPACE.match(value, i + 1).end())
+    if key.startswith(keys):
+      response[key] = item
+    i = WHITESPACE.match(value, i).end()
+    if value[i:i + 1] == '}':
+      return response
+    if value[i:i + 1] != ',':
+      raise ValueError(f'Expected \',\' at {i} of Answer.data')
+    i = WHITESPACE.match(value, i + 1).end()
+
+def decodeConfig(value):
+  payload = base64.b64decode(value)
+  if payload.startswith(COMPRESSED_MARKER):
+    payload = zlib.decompress(payload[len(COMPRESSED_MARKER):])
+  return fastjson.loads(payload)
+
+# Decoded configs by digest of their Input.CONFIG value. A batch assigns every
+# spec to many workers, so most rows are served from here
+_configCache = {}
+
+def indexTasks(config):
+  """
+  Lookups for the task sessions of a decoded config, by session name: the
+  session itself, its message id -> index map and the sorted gold indices for
+  each task type.
+  """
+  tasks = {}
+  for session in configSessions(config):
+    if session['type'] != 'task':
+      continue
+    ids = {}
+    for i, m in enumerate(session['messages']):
+      ids.setdefault(m['id'], i)
+    tasks[session['name']] = {
+      'session': session,
+      'ids': ids,
+      'gold': {
+        'commitment': extractGold(session, 'commitment', ids)
+          if 'commitments' in session else None,
+        'search': extractGold(session, 'search', ids)
+          if 'promoted' in session else None
+      }
+    }
+  return tasks
+
+def loadConfig(value):
+  """
+  Decodes an Input.CONFIG value once per distinct spec. Returns the config and
+  its indexTasks lookups, shared between all workers that got the spec, so
+  treat both as read-only.
+  """
+  key = hashlib.sha1(value.encode()).digest()
+  if not key in _configCache:
+    config = decodeConfig(value)
+    _configCache[key] = (config, indexTasks(config))
+  return _configCache[key]
+
+def clearConfigCache():
+  _configCache.clear()
 
 def lookup(messages, id):
   for i, m in enumerate(messages):
@@ -38,13 +171,15 @@ def lookup(messages, id):
   return None
 
 def match(ref, cmp):
-  prec = sum(1 if v in ref else 0 for v in cmp) / len(cmp)
-  rec = sum(1 if v in cmp else 0 for v in ref) / len(ref)
+  refSet, cmpSet = set(ref), set(cmp)
+  prec = sum(1 if v in refSet else 0 for v in cmp) / len(cmp)
+  rec = sum(1 if v in cmpSet else 0 for v in ref) / len(ref)
   return prec, rec
 
 def mismatched(ref, cmp):
-  excl_cmp = sum(1 if not v in ref else 0 for v in cmp)
-  excl_ref = sum(1 if not v in cmp else 0 for v in ref)
+  refSet, cmpSet = set(ref), set(cmp)
+  excl_cmp = sum(1 if not v in refSet else 0 for v in cmp)
+  excl_ref = sum(1 if not v in cmpSet else 0 for v in ref)
   return excl_cmp + excl_ref
 
 def f1(summary):
@@ -52,156 +187,147 @@ def f1(summary):
   return (2 * p * r / (p + r)) if p > 0 and r > 0 else 0
 
 def buildActionLog(actionStream):
-  experimentsLog = {}
-  for item in actionStream:
-    experimentId = item['ns']
-    if not experimentId in experimentsLog:
-      experimentsLog[experimentId] = {}
-    summary = experimentsLog[experimentId]
-    if item['event'] == 'end':
-      summary['taskTime'] = item['t'] / 1000
-    elif item['event'] == 'flag':
-      summary['flag'] = 1 if not 'flag' in summary else summary['flag'] + 1
-    elif item['event'] == 'tag-event':
-      summary['tag'] = 1 if not 'tag' in summary else summary['tag'] + 1
-    elif item['event'] == 'view-message':
-      summary['view'] = 1 if not 'view' in summary else summary['view'] + 1
-  return experimentsLog
+  # Task time and event counts per experiment, see actionlog.REDUCERS['log']
+  return actionlog.reduceEvents(actionlog.EventTable(actionStream),
+    ['log'])['log']
 
 def analyzeActionLog(actionStream, type = 'commitment'):
+  # Tag sources and reverts, or query sessions and reverts for search
+  return actionlog.reduceEvents(actionlog.EventTable(actionStream),
+    [type])[type]
+
+def configSessions(config):
+  # Accepts a bare session list, a v1 config or a v2 config whose sessions
+  # refer to a shared message table by key
+  if isinstance(config, list):
+    return config
+  if config.get('version') != 2:
+    return config['sessions']
+  table = config['messages']
+  sessions = []
+  for session in config['sessions']:
+    if 'messages' in session:
+      session = dict(session)
+      session['messages'] = [
+        dict(table[ref], id=table[ref].get('id', ref), read=read)
+          for ref, read in zip(session['messages'], session.pop('read'))]
+    sessions.append(session)
+  return sessions
+
+def expandBody(body):
+  # Compact bodies list each paragraph's lines, see build_tasks.py --compact-body
+  return [[{'id': f's-{i}', 't': span + '\n'} if isinstance(span, str) else span
+    for i, span in enumerate(p)] for p in body]
+
+def extractGold(config, type = 'commitment', ids = None):
+  # ids is an optional id -> index map of config['messages']
+  find = (lambda id: lookup(config['messages'], id)) if ids is None else \
+    ids.get
   if type == 'commitment':
-    logs = {}
-    tagged = set()
-    for item in actionStream:
-      expt = item['ns']
-      if not expt in logs:
-        logs[expt] = {
-          'total': 0,
-          'reverted': 0
-        }
-      if item['event'] == 'tag-event':
-        logs[expt]['total'] += 1
-        source = item['data']['source']
-        if source == 'total' or source == 'reverted':
-          raise Exception('Illegal source name!')
-        if not source in logs[expt]:
-          logs[expt][source] = 0
-        logs[expt][source] += 1
-      if item['event'] == 'tag-status-change':
-        message = item['data']['message']
-        if message in tagged:
-          logs[expt]['reverted'] += 1
-        else:
-          tagged.add(message)
-    return logs
-  else:
-    logs = {}
-    lastItem = {}
-    lastQueries = {}
-    tagged = set()
-    for item in actionStream:
-      expt = item['ns']
-      if not expt in logs:
-        logs[expt] = {
-          'queries': set(),
-          'sessions': 0,
-          'reverted': 0,
-          'views': []
-        }
-      if item['event'] == 'search-init':
-        query = item['data']['query']
-
-        # Remove any 1-off substring queries
-        if query[:-1] in logs[expt]['queries']:
-          logs[expt]['queries'].remove(query[:-1])
-        logs[expt]['queries'].add(query)
-
-        if expt in lastItem:
-          if lastItem[expt]['event'] == 'search-init' or lastItem[expt]['event'] == 'search-resp':
-            lastQuery = lastItem[expt]['data']['query']
-            if lastQuery == query[:-1]:
-              logs[expt]['sessions'] += 0 # Part of same session
-            else:
-              logs[expt]['sessions'] += 1
-              lastQueries[expt] = query
-          else:
-            # Something else
-            logs[expt]['sessions'] += 1
-            lastQueries[expt] = query
-        else:
-          # This is the first thing
-          raise Exception('there should be events before search-init!')
-
-      if item['event'] == 'view-message':
-        message = item['data']['message']
-        query = lastQueries[expt] if expt in lastQueries else ''
-        logs[expt]['views'].append((query, message))
-
-      if item['event'] == 'action-status-change':
-        message = item['data']['message']
-        if message in tagged:
-          logs[expt]['reverted'] += 1
-        else:
-          tagged.add(message)
-
-      lastItem[expt] = item
-    return logs
-
-def extractGold(config, type = 'commitment'):
-  if type == 'commitment':
-    gold = sorted([lookup(config['messages'], c)
-      for c in config['commitments']])
+    gold = sorted([find(c) for c in config['commitments']])
   else:
-    gold = sorted([lookup(config['messages'], c)
-      for c in config['promoted']])
+    gold = sorted([find(c) for c in config['promoted']])
   return gold
 
-def extractSummary (sessionsResp, expts, sessionsConfig, type = 'commitment'):
-  taskConfig = {}
-  for task in sessionsConfig:
-    if task['type'] != 'task':
-      continue
-    taskConfig[task['name']] = task
-  summary = {}
+# Task state array and field holding each task type's marks
+MARK_STATUS = {
+  'commitment': ('tagStatus', 'event'),
+  'search': ('actionStatus', 'flagged')
+}
 
-  # Build Action log
-  actLog = buildActionLog(sessionsResp['action-log']['stream'])
-  actAnalysis = analyzeActionLog(sessionsResp['action-log']['stream'], type)
+def statusMatrix(states, key, field = None, size = 0):
+  """
+  Stacks a status array of several task states into a workers x messages
+  boolean matrix (at least `size` wide, False past a short array), reading
+  `field` of each entry when given.
+  """
+  rows = [state[key] for state in states]
+  matrix = np.zeros((len(rows), max([size] + [len(r) for r in rows])),
+    dtype=bool)
+  for i, row in enumerate(rows):
+    if field is None:
+      matrix[i, :len(row)] = [True if v else False for v in row]
+    else:
+      matrix[i, :len(row)] = [True if v[field] else False for v in row]
+  return matrix
+
+def scoreMarks(marked, gold):
+  """
+  Scores a workers x messages boolean matrix of marked messages against the
+  gold message indices, as match and mismatched do one worker at a time
+  (gold ids missing from the inbox count as never marked). Returns arrays of
+  precision, recall and error counts.
+  """
+  n = marked.shape[1]
+  valid = np.array([g for g in gold if not g is None and g < n], dtype=int)
+  counts = np.bincount(valid, minlength=n)
+  isGold = counts > 0
+  markedCount = marked.sum(axis=1)
+  if len(gold) == 0 or (markedCount == 0).any():
+    raise ZeroDivisionError('division by zero')
+  hits = marked.astype(int) @ counts
+  precision = (marked & isGold).sum(axis=1) / markedCount
+  recall = hits / len(gold)
+  error = (marked & ~isGold).sum(axis=1) + len(gold) - hits
+  return precision, recall, error
 
+def extractSummaries(responses, expts, taskLookups, type = 'commitment'):
+  """
+  extractSummary for a batch of workers, given their responses and the
+  indexTasks lookups of their configs. Workers whose configs share a task
+  session (see loadConfig) are scored together with scoreMarks.
+  """
+  summaries = [{} for _ in responses]
+  key, field = MARK_STATUS[type]
   for exp in expts:
-    db = sessionsResp['task-state-' + exp]['map']
-    conf = sessionsResp['config-' + exp]['map']
-    task = taskConfig[exp]
-    if type == 'commitment':
-      tagged = sorted([i
-        for i, t in enumerate(db['tagStatus']) if t['event']])
-    else:
-      tagged = sorted([i
-        for i, t in enumerate(db['actionStatus']) if t['flagged']])
-    gold = extractGold(task, type)
-    prec, rec = match(gold, tagged)
-    read = sum(1 if r else 0 for r in db['readStatus'])
-    summary[exp] = {
-      'marked': tagged,
-      'perf': conf['performance'],
-      'read': read,
-      'total': len(db['readStatus']),
-      'precision': prec,
-      'recall': rec,
-      'error': mismatched(gold, tagged),
-      'log': actLog[exp],
-      'details': actAnalysis[exp]
+    groups = {}
+    for i, tasks in enumerate(taskLookups):
+      task = tasks[exp]
+      groups.setdefault(id(task), (task, []))[1].append(i)
+    for task, members in groups.values():
+      gold = task['gold'][type]
+      if gold is None:
+        gold = extractGold(task['session'], type, task['ids'])
+      states = [responses[i]['task-state-' + exp]['map'] for i in members]
+      marked = statusMatrix(states, key, field)
+      precision, recall, error = scoreMarks(marked, gold)
+      read = statusMatrix(states, 'readStatus').sum(axis=1)
+      for j, i in enumerate(members):
+        summaries[i][exp] = {
+          'marked': np.flatnonzero(marked[j]).tolist(),
+          'perf': responses[i]['config-' + exp]['map']['performance'],
+          'read': int(read[j]),
+          'total': len(states[j]['readStatus']),
+          'precision': float(precision[j]),
+          'recall': float(recall[j]),
+          'error': int(error[j])
+        }
+
+  for sessionsResp, summary in zip(responses, summaries):
+    # Action log metrics in a single pass
+    table = actionlog.EventTable(sessionsResp['action-log']['stream'])
+    logs = actionlog.reduceEvents(table, ['log', type])
+    actLog, actAnalysis = logs['log'], logs[type]
+    for exp in expts:
+      summary[exp]['log'] = actLog[exp]
+      summary[exp]['details'] = actAnalysis[exp]
+      if type == 'commitment':
+        summary[exp]['uptake'] = (actAnalysis[exp]['ai'] if 'ai' in actAnalysis[exp] else 0) / actAnalysis[exp]['total']
+        summary[exp]['corrections'] = actAnalysis[exp]['reverted']
+      elif type == 'search':
+        summary[exp]['uptake'] = (1 / actAnalysis[exp]['sessions']) if actAnalysis[exp]['sessions'] > 0 else 0
+        summary[exp]['corrections'] = actAnalysis[exp]['reverted']
+    summary[''] = {
+      'perf-pattern': ','.join([str(summary[exp]['perf']) for exp in expts][2:])
     }
-    if type == 'commitment':
-      summary[exp]['uptake'] = (actAnalysis[exp]['ai'] if 'ai' in actAnalysis[exp] else 0) / actAnalysis[exp]['total']
-      summary[exp]['corrections'] = actAnalysis[exp]['reverted']
-    elif type == 'search':
-      summary[exp]['uptake'] = (1 / actAnalysis[exp]['sessions']) if actAnalysis[exp]['sessions'] > 0 else 0
-      summary[exp]['corrections'] = actAnalysis[exp]['reverted']
-  summary[''] = {
-    'perf-pattern': ','.join([str(summary[exp]['perf']) for exp in expts][2:])
-  }
-  return summary
+  return summaries
+
+def extractSummary (sessionsResp, expts, sessionsConfig, type = 'commitment',
+  tasks = None):
+  # tasks are the indexTasks lookups of sessionsConfig when already known
+  if tasks is None:
+    tasks = indexTasks(sessionsConfig)
+  return extractSummaries([sessionsResp], expts, [tasks], type)[0]
 
 def extractSurvey (sessionsResp):
   surveyLog = sessionsResp['surveys']['stream']
@@ -211,24 +337,175 @@ def extractSurvey (sessionsResp):
     surveyResponses[expt] = item['answers']
   return surveyResponses
 
-def readWorkers(filename, type = 'commitment'):
-  for worker in readMturkCsv(filename):
-    sessionConfig = json.loads(base64.b64decode(worker["Input.CONFIG"]))
-    id = worker['WorkerId']
-    sessionResp = json.loads(worker["Answer.data"])
+# Columns summarizeWorker reads, the rest of a results row is skipped by the
+# reader
+WORKER_COLUMNS = ('WorkerId', 'Input.CONFIG', 'Answer.data',
+  'Answer.q-feedback', 'Answer.q-explanation', 'Answer.q-preference',
+  'Answer.q-understand')
+RAW_COLUMNS = ('Input.CONFIG', 'Answer.data')
+# Per experiment numbers kept in WorkerRecord.metrics, NaN where missing
+METRICS = ('precision', 'recall', 'f1', 'read', 'total', 'taskTime', 'view',
+  'uptake', 'corrections')
+
+class WorkerRecord():
+  """
+  Summary of one worker. Unpacks like the former (id, sessionConfig,
+  sessionResp, finalQuestions, summary, survey) tuples, except that the raw
+  payloads in it are None until sessionConfig or sessionResp is read, which
+  loads them back from the results CSV.
+  """
+  __slots__ = ('id', 'finalQuestions', 'summary', 'survey', 'metrics',
+    'source', '_config', '_response')
+
+  def __init__(self, id, finalQuestions, summary, survey, source = None):
+    self.id = id
+    self.finalQuestions = finalQuestions
+    self.summary = summary
+    self.survey = survey
+    self.metrics = summaryMetrics(summary)
+    # (filename, byte offset) of the row
+    self.source = source
+    self._config = None
+    self._response = None
+
+  def _loadRaw(self):
+    if self.source is None:
+      raise ValueError(f'No results row to load worker {self.id} from')
+    config, data = readMturkRow(*self.source, RAW_COLUMNS)
+    self._config = loadConfig(config)[0]
+    self._response = loadResponse(data)
+
+  @property
+  def sessionConfig(self):
+    if self._config is None:
+      self._loadRaw()
+    return self._config
+
+  @property
+  def sessionResp(self):
+    if self._response is None:
+      self._loadRaw()
+    return self._response
+
+  def dropRaw(self):
+    self._config, self._response = None, None
+
+  def metric(self, name):
+    # One value per experiment in EXPERIMENTS order
+    return self.metrics[:, METRICS.index(name)]
+
+  def __iter__(self):
+    return iter((self.id, self._config, self._response, self.finalQuestions,
+      self.summary, self.survey))
+
+def summaryMetrics(summary, expts = EXPERIMENTS):
+  metrics = np.full((len(expts), len(METRICS)), np.nan)
+  for i, exp in enumerate(expts):
+    s = summary[exp]
+    values = {
+      'precision': s['precision'],
+      'recall': s['recall'],
+      'f1': f1(s),
+      'read': s['read'],
+      'total': s['total'],
+      'taskTime': s['log'].get('taskTime'),
+      'view': s['log'].get('view'),
+      'uptake': s.get('uptake'),
+      'corrections': s.get('corrections')
+    }
+    for j, name in enumerate(METRICS):
+      if not values[name] is None:
+        metrics[i, j] = values[name]
+  return metrics
+
+def metricMatrix(workers, name):
+  # workers x experiments matrix of one of METRICS
+  j = METRICS.index(name)
+  if len(workers) == 0:
+    return np.empty((0, len(EXPERIMENTS)))
+  return np.stack([w.metrics[:, j] for w in workers])
+
+def summarizeWorkers(rows, type = 'commitment', keepRaw = True,
+  sources = None):
+  """
+  WorkerRecords of a batch of results rows holding WORKER_COLUMNS, found at
+  the given (filename, offset) sources. The batch is scored in one pass.
+  """
+  sources = sources or [None] * len(rows)
+  configs, responses = [], []
+  for row in rows:
+    configs.append(loadConfig(row[1]))
+    responses.append(loadResponse(row[2]))
+  summaries = extractSummaries(responses, EXPERIMENTS,
+    [tasks for _, tasks in configs], type)
+  records = []
+  for row, (sessionConfig, _), sessionResp, summary, source in zip(rows,
+    configs, responses, summaries, sources):
+    id, _, _, feedback, explanation, preference, understand = row
     finalQuestions = {
-      'feedback': worker["Answer.q-feedback"],
-      'explanation': worker["Answer.q-explanation"],
-      'preference': worker["Answer.q-preference"],
-      'understand': worker["Answer.q-understand"]
+      'feedback': feedback,
+      'explanation': explanation,
+      'preference': preference,
+      'understand': understand
     }
-    summary = extractSummary(sessionResp, EXPERIMENTS, sessionConfig, type)
-    survey = extractSurvey(sessionResp)
-    yield (id, sessionConfig, sessionResp, finalQuestions, summary, survey)
+    record = WorkerRecord(id, finalQuestions, summary,
+      extractSurvey(sessionResp), source)
+    if keepRaw:
+      record._config, record._response = sessionConfig, sessionResp
+    records.append(record)
+  return records
+
+def summarizeWorker(row, type = 'commitment', keepRaw = True, source = None):
+  return summarizeWorkers([row], type, keepRaw, [source])[0]
+
+def _chunks(filenames, chunkSize):
+  # ((filename, offset), row) pairs of WORKER_COLUMNS in chunks of chunkSize
+  chunk = []
+  for filename in filenames:
+    for offset, row in readMturkCsv(filename, WORKER_COLUMNS, offsets=True):
+      chunk.append(((filename, offset), row))
+      if len(chunk) == chunkSize:
+        yield chunk
+        chunk = []
+  if len(chunk) > 0:
+    yield chunk
+
+def _summarizeChunk(job):
+  chunk, type, keepRaw = job
+  return summarizeWorkers([row for _, row in chunk], type, keepRaw,
+    [source for source, _ in chunk])
+
+def readWorkers(filename, type = 'commitment', keepRaw = False,
+  chunkSize = 256):
+  """
+  WorkerRecords of a results CSV, scored in chunks of `chunkSize` rows. Raw
+  payloads are loaded on demand unless keepRaw is set.
+  """
+  for chunk in _chunks([filename], chunkSize):
+    yield from _summarizeChunk((chunk, type, keepRaw))
+
+def readWorkersParallel(filenames, type = 'commitment', jobs = None,
+  chunkSize = 64, keepRaw = False):
+  """
+  Same records as readWorkers over several files, in file and row order, with
+  rows summarized by a pool of `jobs` processes in chunks of `chunkSize`.
+  """
+  jobs = jobs or os.cpu_count() or 1
+
+  with ProcessPoolExecutor(jobs) as pool:
+    # Only keep a few chunks in flight so rows stream through
+    pending = deque()
+    for chunk in _chunks(filenames, chunkSize):
+      pending.append(pool.submit(_summarizeChunk, (chunk, type, keepRaw)))
+      if len(pending) > 2 * jobs:
+        yield from pending.popleft().result()
+    while len(pending) > 0:
+      yield from pending.popleft().result()
 
 def filter(workers, task = 'commitment'):
   out = []
-  for id, sc, sr, fq, s, sur in workers:
+  for worker in workers:
+    s = worker.summary
     if task == 'search':
       failed = 0
       for exp in EXPERIMENTS:
@@ -240,7 +517,7 @@ def filter(workers, task = 'commitment'):
       if failed == 6:
         continue
       else:
-        out.append((id, sc, sr, fq, s, sur))
+        out.append(worker)
     elif task == 'commitment':
       failed = 0
       for exp in EXPERIMENTS:
@@ -250,7 +527,7 @@ def filter(workers, task = 'commitment'):
       if failed == 6:
         continue
       else:
-        out.append((id, sc, sr, fq, s, sur))
+        out.append(worker)
 
   return out
 
@@ -271,9 +548,8 @@ if __name__ == '__main__':
 
   ids, summaries = [], []
   for workerRecord in readWorkers(sys.argv[1], taskType):
-    (id, sessionConfig, sessionResp, finalQuestions, summary, survey) = workerRecord
-    ids.append(id)
-    summaries.append(summary)
+    ids.append(workerRecord.id)
+    summaries.append(workerRecord.summary)
 
   for exp in EXPERIMENTS:
     print(f'{exp}:')
@@ -0,0 +1,149 @@
+"""compare
+Comparative data.json of two worker groups (e.g. two perf-patterns): the
+reports of both groups merged the way the compare report app reads them, with
+label permutation tests of every metric export.py extracts (see
+resample.permutationTest).
+"""
+import os
+import sys
+
+import numpy as np
+
+import analysis
+import export
+import fastjson
+import resample
+
+GROUPS = ('A', 'B')
+# Significance level of the findings
+ALPHA = 0.05
+
+def mergeSeries(a, b):
+  # Series of both reports tagged with the group they come from
+  return [dict(s, group=GROUPS[0]) for s in a] + \
+    [dict(s, group=GROUPS[1]) for s in b]
+
+def mergeBars(a, b, names):
+  # One bar per group for each answer, labeled with the group names
+  return [dict(sa, x=sa['x'] + sb['x'], y=list(names)) for sa, sb in zip(a, b)]
+
+def mergeFindings(a, b, names):
+  return [f'{names[0]}: {f}' for f in a] + [f'{names[1]}: {f}' for f in b]
+
+def preferences(workers):
+  return np.array([int(w.finalQuestions['preference']) for w in workers],
+    dtype=float)
+
+def compareGroups(workersA, workersB, frameA = None, frameB = None,
+  rounds = resample.PERMUTATIONS):
+  """
+  Permutation tests of group B against group A for every column in
+  export.REPORT_COLUMNS per experiment, and the final preference. Returns
+  {column: {'x', 'diff', 'p'}} with x the experiment indices and diff the mean
+  of B minus the mean of A, and {'diff', 'p'} for 'preference'. Everything is
+  tested in one pass, so the p-values are not corrected for multiple
+  comparisons.
+  """
+  if frameA is None:
+    frameA = export.workerFrame(workersA)
+  if frameB is None:
+    frameB = export.workerFrame(workersB)
+  size = len(analysis.EXPERIMENTS)
+  a = np.column_stack([export.workerMatrix(frameA), preferences(workersA)])
+  b = np.column_stack([export.workerMatrix(frameB), preferences(workersB)])
+  diff, p = resample.permutationTest(a, b, rounds)
+  tests = {}
+  for i, column in enumerate(export.REPORT_COLUMNS):
+    tests[column] = {
+      'x': list(range(size)),
+      'diff': diff[i * size:(i + 1) * size].tolist(),
+      'p': p[i * size:(i + 1) * size].tolist()
+    }
+  tests['preference'] = {'diff': diff[-1].item(), 'p': p[-1].item()}
+  return tests
+
+def testFinding(label, test, names):
+  # Experiments where label differs between the groups at ALPHA
+  if 'x' in test:
+    significant = [str(x) for x, p in zip(test['x'], test['p']) if p < ALPHA]
+  else:
+    significant = ['all'] if test['p'] < ALPHA else []
+  if len(significant) == 0:
+    return f'No significant difference in {label} between {names[0]} and ' + \
+      f'{names[1]} (permutation test, p >= {ALPHA}).'
+  where = '' if significant == ['all'] else \
+    f' in experiment{"s" if len(significant) > 1 else ""} ' + \
+    ', '.join(significant)
+  return f'{label[0].upper() + label[1:]} differs between {names[0]} and ' + \
+    f'{names[1]}{where} (permutation test, p < {ALPHA}).'
+
+def mergeReports(a, b, tests, names = GROUPS):
+  """
+  Comparative data.json from the data.json of both groups (see
+  export.buildReport) and their tests (see compareGroups).
+  """
+  overview = {}
+  for item, label, column, merge in (
+    ('f1', 'average F-1 score', 'f1', mergeSeries),
+    ('effort', 'effort (% emails read)', 'read', mergeSeries),
+    ('preference', 'preference', 'preference',
+      lambda sa, sb: mergeBars(sa, sb, names))):
+    overview[item] = {
+      'findings': mergeFindings(a['overview'][item]['findings'],
+        b['overview'][item]['findings'], names) +
+        [testFinding(label, tests[column], names)],
+      'series': merge(a['overview'][item]['series'],
+        b['overview'][item]['series'])
+    }
+  return {
+    'overview': overview,
+    'feedback': {GROUPS[0]: a['feedback'], GROUPS[1]: b['feedback']},
+    'qual': {
+      'line': {header: mergeSeries(series, b['qual']['line'][header])
+        for header, series in a['qual']['line'].items()}
+    },
+    'quant': {
+      name: {
+        'name': table['name'],
+        'series': mergeSeries(table['series'], b['quant'][name]['series'])
+      }
+      for name, table in a['quant'].items()
+    },
+    'tests': tests
+  }
+
+def buildComparison(workersA, workersB, names = GROUPS):
+  frameA = export.workerFrame(workersA)
+  frameB = export.workerFrame(workersB)
+  return mergeReports(export.buildReport(workersA, frameA),
+    export.buildReport(workersB, frameB),
+    compareGroups(workersA, workersB, frameA, frameB), names)
+
+if __name__ == '__main__':
+  if len(sys.argv) < 5:
+    export.eprint(f'Usage: {sys.argv[0]} [mturkdir] [task] [patternA] ' +
+      '[patternB] [nameA] [nameB]')
+    export.eprint('    [mturkdir] directory containing mturk responses')
+    export.eprint('    [task] Task group')
+    export.eprint('    [patternA], [patternB] Conditions to compare')
+    export.eprint('    [nameA], [nameB] Labels of the groups (Default A, B)')
+    exit(1)
+
+  sourcedir = sys.argv[1].strip()
+  task = sys.argv[2].strip()
+  patterns = (sys.argv[3].strip(), sys.argv[4].strip())
+  names = (sys.argv[5].strip(), sys.argv[6].strip()) \
+    if len(sys.argv) > 6 else GROUPS
+
+  if not os.path.isdir(sourcedir):
+    raise ValueError(f'Path {sourcedir} is not a directory!')
+
+  if not task in ['commitment', 'search']:
+    raise ValueError(f'Task type {task} not supported!')
+
+  groups = export.loadWorkers(sourcedir, task)
+  workersA, workersB = [groups.get(pattern, []) for pattern in patterns]
+  export.eprint(f'Total of {len(workersA)} + {len(workersB)} workers loaded!')
+
+  sys.stdout.buffer.write(fastjson.dumps(
+    buildComparison(workersA, workersB, names), indent=True) + b'\n')
@@ -1,5 +1,9 @@
+import os
+import sys
+
 import analysis
-import json
+import fastjson
+import resample
 import pandas as pd
 import scipy.stats as ss
 import numpy as np
@@ -7,19 +11,105 @@ import numpy as np
 def eprint(*args, **kwargs):
     print(*args, file=sys.stderr, **kwargs)
 
-def pivotAndAggregate(df, values, index):
-  renameMap = {}
-  if isinstance(values, list):
-    for name in values:
-      renameMap[name] = name + '_err'
-  else:
-    renameMap[values] = values + '_err'
-  df_p = df.pivot_table(values=values, aggfunc='mean', index=index)
-  df_pe = df.pivot_table(values=values,
-    aggfunc=ss.sem, index=index).rename(columns=renameMap)
-  return df_p.join(df_pe).reset_index()
+# Experiments from this index on are run with the AI
+AI_START = 2
+# Survey questions asked after every experiment
+QUESTIONS = ('confidence', 'effort', 'mentalmodel', 'stickiness', 'trust',
+  'utility')
+# Frame columns taken from analysis.METRICS
+MEASURES = {
+  'f1': 'f1',
+  'time': 'taskTime',
+  'view': 'view',
+  'uptake': 'uptake',
+  'corrections': 'corrections'
+}
+# Counts, kept as integers unless a value is missing
+COUNTS = ('view', 'corrections') + QUESTIONS
+# Columns the report aggregates
+REPORT_COLUMNS = ('f1', 'read', 'time', 'view', 'uptake',
+  'corrections') + QUESTIONS
+
+def workerFrame(workers):
+  """
+  Tidy frame of everything the report plots, with a row per experiment and
+  worker (experiment major). exp is the index in analysis.EXPERIMENTS, read is
+  the share of emails read and the survey answers are NaN where skipped.
+  """
+  size = len(analysis.EXPERIMENTS)
+  columns = {
+    'exp': np.repeat(np.arange(size), len(workers)),
+    'id': np.tile(np.array([w.id for w in workers], dtype=object), size)
+  }
+  for column, metric in MEASURES.items():
+    columns[column] = analysis.metricMatrix(workers, metric).T.ravel()
+  columns['read'] = (analysis.metricMatrix(workers, 'read') /
+    analysis.metricMatrix(workers, 'total')).T.ravel()
+  for question in QUESTIONS:
+    columns[question] = np.array([
+      int(w.survey[e][question]) if question in w.survey[e] else np.nan
+      for e in analysis.EXPERIMENTS for w in workers
+    ], dtype=float)
+  frame = pd.DataFrame(columns)
+  for column in COUNTS:
+    if frame[column].notna().all():
+      frame[column] = frame[column].astype('int64')
+  return frame
 
-def extract_overview(workers):
+def workerMatrix(frame, columns = REPORT_COLUMNS):
+  # workers x (column, experiment) array of a worker frame
+  size = len(analysis.EXPERIMENTS)
+  return np.hstack([frame[column].to_numpy(dtype=float).reshape(size, -1).T
+    for column in columns])
+
+def aggregate(frame, columns = REPORT_COLUMNS):
+  """
+  Mean, standard error and bootstrap interval (low, high) of each column per
+  experiment. The interval resamples workers, so all experiments and columns
+  of a resample have the same workers (see resample.bootstrapInterval).
+  """
+  columns = list(columns)
+  stats = frame.groupby('exp')[columns].agg(['mean', ss.sem])
+  size = len(analysis.EXPERIMENTS)
+  low, high = resample.bootstrapInterval(workerMatrix(frame, columns))
+  intervals = pd.DataFrame({
+    (column, bound): values[i * size:(i + 1) * size]
+    for i, column in enumerate(columns)
+    for bound, values in (('low', low), ('high', high))
+  }, index=range(size))
+  return stats.join(intervals)
+
+def rawPairs(exps, values):
+  # 'exp,value|...' as read by decodeSubSeries in the report apps
+  pairs = np.char.add(np.char.add(exps.astype(str), ','), values.astype(str))
+  return '|'.join(pairs.tolist())
+
+def splitSeries(frame, stats, column, raw = True):
+  """
+  With-AI and No-AI series of a frame column from its aggregate (see
+  aggregate), leaving out experiments without any value. ci holds the
+  [low, high] bootstrap interval of each y, raw adds the value of every worker.
+  """
+  values = stats[column].dropna(subset=['mean'])
+  rows = frame['exp'].to_numpy() >= AI_START
+  series = []
+  for name, ai in (('With-AI', True), ('No-AI', False)):
+    part = values[(values.index >= AI_START) == ai]
+    s = {
+      'x': part.index.tolist(),
+      'y': part['mean'].tolist(),
+      'error_y': part['sem'].tolist(),
+      'ci': part[['low', 'high']].to_numpy().tolist(),
+      'name': name
+    }
+    if raw:
+      selected = frame[rows == ai]
+      s['raw'] = rawPairs(selected['exp'].to_numpy(),
+        selected[column].to_numpy())
+    series.append(s)
+  return series
+
+def extract_overview(workers, frame = None, stats = None):
   PREFERENCES = [
     ('Strongly prefer No-AI', 'rgb(128,24,43)', 1),
     ('Prefer No-AI', 'rgb(214,96,77)', 2),
@@ -29,13 +119,10 @@ def extract_overview(workers):
     ('Prefer With-AI', 'rgb(67,147,195)', 6),
     ('Strongly prefer With-AI', 'rgb(33,102,172)', 7)
   ]
-  overview = [
-    (id, e, analysis.f1(s[e]), s[e]['read'] / s[e]['total'])
-    for e in analysis.EXPERIMENTS for id, cfg, rsp, q, s, sr in workers
-  ]
-  df_ov = pd.DataFrame(overview, columns=('id', 'exp', 'f1', 'read'))
-  df_ov_agg = pivotAndAggregate(df_ov,
-    values=['f1', 'read'], index=['exp'])
+  if frame is None:
+    frame = workerFrame(workers)
+  if stats is None:
+    stats = aggregate(frame, ('f1', 'read'))
   offline_f1 = {
     'x': [2,3,4,5],
     'y': [0, 0, 1, 1],
@@ -43,55 +130,11 @@ def extract_overview(workers):
     'marker': 'x',
     'name': 'Offline'
   }
+  with_ai_f1, no_ai_f1 = splitSeries(frame, stats, 'f1', raw=False)
+  with_ai_effort, no_ai_effort = splitSeries(frame, stats, 'read', raw=False)
 
-  with_ai_f1 = {
-    'x': [],
-    'y': [],
-    'error_y': [],
-    'name': 'With-AI'
-  }
-  no_ai_f1 = {
-    'x': [],
-    'y': [],
-    'error_y': [],
-    'name': 'No-AI'
-  }
-  with_ai_effort = {
-    'x': [],
-    'y': [],
-    'error_y': [],
-    'name': 'With-AI'
-  }
-  no_ai_effort = {
-    'x': [],
-    'y': [],
-    'error_y': [],
-    'name': 'No-AI'
-  }
-  for index, row in df_ov_agg.iterrows():
-    exp_index = analysis.EXPERIMENTS.index(row['exp'])
-    if exp_index < 2:
-      no_ai_f1['x'].append(exp_index)
-      no_ai_f1['y'].append(row['f1'])
-      no_ai_f1['error_y'].append(row['f1_err'])
-      no_ai_effort['x'].append(exp_index)
-      no_ai_effort['y'].append(row['read'])
-      no_ai_effort['error_y'].append(row['read_err'])
-    else:
-      with_ai_f1['x'].append(exp_index)
-      with_ai_f1['y'].append(row['f1'])
-      with_ai_f1['error_y'].append(row['f1_err'])
-      with_ai_effort['x'].append(exp_index)
-      with_ai_effort['y'].append(row['read'])
-      with_ai_effort['error_y'].append(row['read_err'])
-
-  ratios, prefs = {}, []
-  for id, cfg, rsp, fq, s, sr in workers:
-    pref = int(fq['preference'])
-    prefs.append(pref)
-    if not pref in ratios:
-      ratios[pref] = 0
-    ratios[pref] += 1
+  prefs = np.array([int(w.finalQuestions['preference']) for w in workers])
+  ratios = np.bincount(prefs, minlength=len(PREFERENCES) + 1)
 
   avg_f1 = {
     'No-AI': sum(no_ai_f1['y']) / 2,
@@ -103,15 +146,12 @@ def extract_overview(workers):
   }
   delta_f1 = avg_f1['With-AI'] / avg_f1['No-AI'] - 1;
   delta_effort = avg_effort['With-AI'] / avg_effort['No-AI'] - 1;
-  avg_pref = sum([v*ratios[v] for v in ratios]) / len(workers)
-  med_pref = np.median(np.array(prefs))
+  avg_pref = prefs.mean()
+  med_pref = np.median(prefs)
 
   # Do sign test
-  neg, pos = sum(1 for p in prefs if p < 4), sum(1 for p in prefs if p > 4)
-  p = ss.binom(neg + pos, 0.5)
-  cp = 0
-  for k in range(0, min(neg, pos) + 1):
-    cp += p.pmf(k)
+  neg, pos = int((prefs < 4).sum()), int((prefs > 4).sum())
+  cp = ss.binom.cdf(min(neg, pos), neg + pos, 0.5)
   if cp < 0.05:
     sign_test = 'The preferences are statistically significant ' + \
       f'(sign test, p = {round(cp*100)/100}) towards ' + \
@@ -185,7 +225,7 @@ def extract_feedback(workers):
     {'p': pref, 't': text} for pref, text in sorted_workers
   ]
 
-def extract_qual(workers):
+def extract_qual(workers, frame = None, stats = None):
   HEADERS = [
     ('confidence', 0),
     ('effort', 0),
@@ -203,70 +243,31 @@ def extract_qual(workers):
     ('6 - Agree', 'rgb(67,147,195)', 6),
     ('7 - Strongly Agree', 'rgb(33,102,172)', 7)
   ]
-  surveys = [(id, e, q, int(sr[e][q]) if q in sr[e] else None)
-               for q in [h.replace(' ', '') for h, _ in HEADERS]
-               for e in analysis.EXPERIMENTS
-               for id, _, _, _, s, sr in workers]
-  df_survey = pd.DataFrame(surveys, columns=('id', 'exp', 'question', 'answer'))
-  df_survey_agg = pivotAndAggregate(df_survey, 'answer', ['exp', 'question'])
+  if frame is None:
+    frame = workerFrame(workers)
+  if stats is None:
+    stats = aggregate(frame, QUESTIONS)
   line_named = {}
   for header, _ in HEADERS:
-    question = header.replace(' ', '')
-    with_ai, no_ai = {
-      'x': [], 'y': [],'error_y': [], 'name': 'With-AI'}, {
-      'x': [], 'y': [],'error_y': [], 'name': 'No-AI'}
-    for i, row in df_survey_agg[df_survey_agg['question'] == question].iterrows():
-      exp_idx = analysis.EXPERIMENTS.index(row['exp'])
-      if exp_idx >= 2:
-        with_ai['x'].append(exp_idx)
-        with_ai['y'].append(row['answer'])
-        with_ai['error_y'].append(row['answer_err'])
-      else:
-        no_ai['x'].append(exp_idx)
-        no_ai['y'].append(row['answer'])
-        no_ai['error_y'].append(row['answer_err'])
-
-    raw_with_ai, raw_no_ai = [], []
-    for i, row in df_survey[df_survey['question'] == question].iterrows():
-      exp_idx = analysis.EXPERIMENTS.index(row['exp'])
-      if exp_idx >= 2:
-        raw_with_ai.append((exp_idx, row['answer']))
-      else:
-        raw_no_ai.append((exp_idx, row['answer']))
-
-    with_ai['raw'] = '|'.join([f'{x[0]},{x[1]}' for x in raw_with_ai])
-    no_ai['raw'] = '|'.join([f'{x[0]},{x[1]}' for x in raw_no_ai])
-
+    with_ai, no_ai = splitSeries(frame, stats, header.replace(' ', ''))
     if len(no_ai['x']) == 0:
       line_named[header] = [with_ai]
     else:
       line_named[header] = [with_ai, no_ai]
 
   bar_named = {}
+  exps = range(AI_START, len(analysis.EXPERIMENTS))
   for header, r_start in HEADERS:
     question = header.replace(' ', '')
+    # Workers by (answer, exp), skipped answers are dropped
+    counts = frame.groupby([question, 'exp']).size()
     data = []
-    # Aggregate the x, ys
-    grouped = {}
-    for v in range(1, 8):
-      grouped[v] = {}
-    for _, exp, q, ans in surveys:
-      if question != q:
-        continue
-      exp_idx = analysis.EXPERIMENTS.index(exp)
-      if not ans in grouped:
-        grouped[ans] = {}
-      if not exp_idx in grouped[ans]:
-        grouped[ans][exp_idx] = 0
-      grouped[ans][exp_idx] += 1
     for name, color, value in GROUPS:
       x, y = [
-          (grouped[value][exp_idx] / len(workers) * (-1 if value < 4 else 1))
-          if exp_idx in grouped[value] else 0
-          for exp_idx in range(2, 6)
-        ], [
-          exp_idx for exp_idx in range(2, 6)
-        ]
+          (counts[value, exp_idx] / len(workers) * (-1 if value < 4 else 1))
+          if (value, exp_idx) in counts.index else 0
+          for exp_idx in exps
+        ], list(exps)
       data.append({
         'x': x,
         'y': y,
@@ -281,59 +282,55 @@ def extract_qual(workers):
     'bar': bar_named
   }
 
-def extract_quant(workers):
+def extract_quant(workers, frame = None, stats = None):
   HEADERS = [
     ('work time', 'Task Work Time (s)', 'time'),
     ('opened', 'Items opened (count)', 'view'),
     ('corrections', 'Corrective Label Actions (%)', 'corrections'),
     ('uptake', 'Uptake Metric (1/#queries)', 'uptake')
   ]
-  qual = [
-    (id, e,
-      s[e]['log']['taskTime'], s[e]['log']['view'],
-      s[e]['uptake'], s[e]['corrections'])
-    for e in analysis.EXPERIMENTS
-    for id, cfg, rsp, q, s, sr in workers
-  ]
-  df_qual = pd.DataFrame(qual,
-    columns=('id', 'exp', 'time', 'view', 'uptake', 'corrections'))
-  df_qual_agg =pivotAndAggregate(df_qual,
-    values=['time', 'view', 'uptake', 'corrections'],
-    index=['exp'])
+  if frame is None:
+    frame = workerFrame(workers)
+  if stats is None:
+    stats = aggregate(frame, [id for _, _, id in HEADERS])
   quant_data = {}
   for name, desc, id in HEADERS:
-    with_ai = {'x': [], 'y': [], 'error_y': [], 'name': 'With-AI'}
-    no_ai = {'x': [], 'y': [], 'error_y': [], 'name': 'No-AI'}
-    for i, row in df_qual_agg.iterrows():
-      exp_idx = analysis.EXPERIMENTS.index(row['exp'])
-      if exp_idx < 2:
-        no_ai['y'].append(row[id])
-        no_ai['error_y'].append(row[id + '_err'])
-        no_ai['x'].append(exp_idx)
-      else:
-        with_ai['y'].append(row[id])
-        with_ai['error_y'].append(row[id + '_err'])
-        with_ai['x'].append(exp_idx)
-    raw_with_ai, raw_no_ai = [], []
-    for i, row in df_qual.iterrows():
-      exp_idx = analysis.EXPERIMENTS.index(row['exp'])
-      if exp_idx < 2:
-        raw_no_ai.append((exp_idx, row[id]))
-      else:
-        raw_with_ai.append((exp_idx, row[id]))
-    with_ai['raw'] = '|'.join([f'{x[0]},{x[1]}' for x in raw_with_ai])
-    no_ai['raw'] = '|'.join([f'{x[0]},{x[1]}' for x in raw_no_ai])
     quant_data[name] = {
       'name': desc,
-      'series': [
-        with_ai,
-        no_ai
-      ]
+      'series': splitSeries(frame, stats, id)
     }
   return quant_data
 
+def loadWorkers(sourcedir, task):
+  # Filtered workers of every CSV in sourcedir, by perf-pattern
+  csvfiles = sorted([csvfile for csvfile in os.listdir(sourcedir)
+    if csvfile.lower().endswith('.csv')])
+  eprint(f'Loading files {", ".join(csvfiles)}')
+  raw_workers = list(analysis.readWorkersParallel(
+    [os.path.join(sourcedir, csvfile) for csvfile in csvfiles], task))
+  patterns = {}
+  for w in analysis.filter(raw_workers, task):
+    patterns.setdefault(w.summary['']['perf-pattern'], []).append(w)
+  return patterns
+
+def buildReport(workers, frame = None):
+  # The data.json of a group of workers
+  if frame is None:
+    # One row per worker and experiment, shared by every section
+    frame = workerFrame(workers)
+  stats = aggregate(frame)
+  return {
+    # Generate overview
+    'overview': extract_overview(workers, frame, stats),
+    # Generate feedback
+    'feedback': extract_feedback(workers),
+    # Generate qual stuff
+    'qual': extract_qual(workers, frame, stats),
+    # Generate quant stuff
+    'quant': extract_quant(workers, frame, stats)
+  }
+
 if __name__ == '__main__':
-  import sys, os
   if len(sys.argv) < 3:
     eprint(f'Usage: {sys.argv[0]} - [mturkdir] [task] [pattern]')
     eprint('    [mturkdir] directory containing mturk responses')
@@ -351,32 +348,8 @@ if __name__ == '__main__':
   if not task in ['commitment', 'search']:
     raise Error(f'Task type {task} not supported!')
 
-  raw_workers = []
-  for csvfile in os.listdir(sourcedir):
-    if not csvfile.lower().endswith('.csv'):
-      continue
-    eprint(f'Loading file {csvfile}')
-    for w in analysis.readWorkers(os.path.join(sourcedir, csvfile), task):
-      raw_workers.append(w)
-
-  workers = analysis.filter(raw_workers, task)
-  workers = [(id, sConfig, sResp, fq, summary, survey)
-    for id, sConfig, sResp, fq, summary, survey in workers
-    if summary['']['perf-pattern'] == pattern]
+  workers = loadWorkers(sourcedir, task).get(pattern, [])
   eprint(f'Total of {len(workers)} workers loaded!')
 
-  # Generate overview
-  overview = extract_overview(workers)
-  # Generate feedback
-  user_feedback = extract_feedback(workers)
-  # Generate qual stuff
-  qual = extract_qual(workers)
-  # Generate quant stuff
-  quant = extract_quant(workers)
-
-  print(json.dumps({
-    'overview': overview,
-    'feedback': user_feedback,
-    'qual': qual,
-    'quant': quant
-  }, indent=2))
+  sys.stdout.buffer.write(fastjson.dumps(buildReport(workers), indent=True) +
+    b'\n')
@@ -0,0 +1,78 @@
+"""fastjson
+JSON through orjson when it is installed, with the stdlib json module as the
+fallback. Both backends return compact UTF-8 bytes (or 2-space indented ones)
+that parse to the same values: numpy numbers are written as plain numbers and
+NaN or infinite floats as null. Keep in sync with tools/deploy/tools/fastjson.
+"""
+import json
+import math
+import numbers
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+BACKEND = 'json' if orjson is None else 'orjson'
+
+def _default(value):
+  # numpy scalars and other registered numbers
+  if isinstance(value, numbers.Integral):
+    return int(value)
+  if isinstance(value, numbers.Real):
+    return float(value)
+  raise TypeError(f'Type is not JSON serializable: {type(value).__name__}')
+
+def _finite(value):
+  if isinstance(value, float):
+    return value if math.isfinite(value) else None
+  if isinstance(value, dict):
+    return {k: _finite(v) for k, v in value.items()}
+  if isinstance(value, (list, tuple)):
+    return [_finite(v) for v in value]
+  return value
+
+def _stdlibDumps(value, indent, ascii):
+  options = {
+    'indent': 2 if indent else None,
+    'separators': (',', ': ') if indent else (',', ':'),
+    'ensure_ascii': ascii,
+    'default': _default,
+    'allow_nan': False
+  }
+  try:
+    text = json.dumps(value, **options)
+  except ValueError:
+    text = json.dumps(_finite(value), **options)
+  return text.encode('utf-8')
+
+def dumps(value, indent = False, ascii = False):
+  """
+  Serializes value to bytes. ascii escapes every non-ASCII character, for
+  payloads that are read back as latin-1 (e.g. atob in the browser).
+  """
+  if orjson is None:
+    return _stdlibDumps(value, indent, ascii)
+  option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+  try:
+    data = orjson.dumps(value, default=_default, option=option)
+  except TypeError:
+    # e.g. integers beyond 64 bits, which the stdlib encoder handles
+    return _stdlibDumps(value, indent, ascii)
+  if ascii and not data.isascii():
+    return _stdlibDumps(value, indent, ascii)
+  return data
+
+def loads(data):
+  # Accepts str, bytes or bytearray
+  if orjson is None:
+    return json.loads(data)
+  try:
+    return orjson.loads(data)
+  except orjson.JSONDecodeError:
+    # NaN literals, integers beyond 64 bits and the like
+    return json.loads(data)
+
+def dump(value, f, indent = False):
+  # f is a binary file
+  f.write(dumps(value, indent))
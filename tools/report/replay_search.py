@@ -0,0 +1,103 @@
+import analysis
+import json
+import numpy as np
+import pandas as pd
+from searchrank import SearchRanker
+
+DEFAULT_KS = [1, 3, 5, 10]
+
+def eprint(*args, **kwargs):
+    print(*args, file=sys.stderr, **kwargs)
+
+def sessionKey(session):
+  # Workers that got the same spec share an inbox and therefore a ranker
+  return (tuple(m['id'] for m in session['messages']),
+    json.dumps(session.get('index'), sort_keys=True))
+
+def collectQueries(csvfiles):
+  """
+  Groups the final queries of every worker's search sessions (see
+  analysis.analyzeActionLog) by inbox. Returns {key: (ranker, promoted
+  message indices, [(worker, session, query)])}.
+  """
+  batches = {}
+  for filename in csvfiles:
+    for worker, config, data in analysis.readMturkCsv(filename,
+      ('WorkerId', 'Input.CONFIG', 'Answer.data')):
+      _, tasks = analysis.loadConfig(config)
+      response = analysis.loadResponse(data, ('action-log',))
+      stream = response['action-log']['stream']
+      logs = analysis.analyzeActionLog(stream, 'search')
+      for session in (task['session'] for task in tasks.values()):
+        if session.get('task') != 'search' or not session['name'] in logs:
+          continue
+        key = sessionKey(session)
+        if not key in batches:
+          promoted = set(session.get('promoted', []))
+          batches[key] = (
+            SearchRanker(session['messages'], session.get('index'),
+              session.get('searchIndex')),
+            [i for i, m in enumerate(session['messages']) if m['id'] in promoted],
+            [])
+        batches[key][2].extend((worker, session['name'], query)
+          for query in sorted(logs[session['name']]['queries']))
+  return batches
+
+def replay(batches, ks = DEFAULT_KS):
+  """
+  Ranks every query of every batch. Returns one row per query with the best
+  rank of a promoted email (inf when none is returned) and recall@k, the share
+  of promoted emails within the top k.
+  """
+  frames = []
+  for ranker, targets, queries in batches.values():
+    queries = [q for q in queries if not ranker.queryTerms(q[2]) is None]
+    if len(targets) == 0 or len(queries) == 0:
+      continue
+    ranks = ranker.ranks([query for _, _, query in queries], targets)
+    df = pd.DataFrame(queries, columns=('worker', 'session', 'query'))
+    df['rank'] = ranks.min(axis=1)
+    for k in ks:
+      df[f'recall@{k}'] = (ranks <= k).mean(axis=1)
+    frames.append(df)
+  columns = ['worker', 'session', 'query', 'rank'] + [f'recall@{k}' for k in ks]
+  return pd.concat(frames, ignore_index=True) if len(frames) > 0 else \
+    pd.DataFrame(columns=columns)
+
+def summarize(df):
+  df = df.assign(rr=1 / df['rank'], found=np.isfinite(df['rank']))
+  recalls = [c for c in df.columns if c.startswith('recall@')]
+  summary = df.groupby('session').agg(
+    queries=('query', 'size'),
+    mrr=('rr', 'mean'),
+    found=('found', 'mean'),
+    **{c: (c, 'mean') for c in recalls})
+  summary['median_rank'] = df[df['found']].groupby('session')['rank'].median()
+  return summary
+
+if __name__ == '__main__':
+  import sys, os
+  if len(sys.argv) < 2:
+    eprint(f'Usage: {sys.argv[0]} [mturkdir] [ks] [outfile]')
+    eprint('    [mturkdir] directory containing mturk responses')
+    eprint('    [ks] Comma separated cut-offs for recall@k (Default 1,3,5,10)')
+    eprint('    [outfile] Optional CSV of per query ranks')
+    exit(1)
+
+  sourcedir = sys.argv[1].strip()
+  ks = [int(k) for k in sys.argv[2].split(',')] if len(sys.argv) > 2 else \
+    DEFAULT_KS
+
+  if not os.path.isdir(sourcedir):
+    raise Exception(f'Path {sourcedir} is not a directory!')
+
+  csvfiles = [os.path.join(sourcedir, csvfile)
+    for csvfile in sorted(os.listdir(sourcedir))
+    if csvfile.lower().endswith('.csv')]
+  batches = collectQueries(csvfiles)
+  eprint(f'Replaying {sum(len(b[2]) for b in batches.values())} queries ' +
+    f'over {len(batches)} inbox(es)')
+  df = replay(batches, ks)
+  print(summarize(df).to_string())
+  if len(sys.argv) > 3:
+    df.to_csv(sys.argv[3], index=False)
@@ -0,0 +1,112 @@
+"""resample
+Resampling statistics over workers: bootstrap intervals and permutation tests.
+Resamples are drawn from one seeded generator so reports are reproducible, and
+every column of a workers x columns array is resampled with the same draws in
+one matrix product.
+"""
+import numpy as np
+
+# Bootstrap resamples, confidence level and seed used by the report
+ROUNDS = 2000
+LEVEL = 0.95
+SEED = 0
+# Label permutations of a comparison
+PERMUTATIONS = 10000
+# Resamples drawn at a time, bounds the memory of the weight matrix
+BLOCK = 256
+
+def bootstrapWeights(rng, size, rounds):
+  # rounds x size matrix of how often each worker is drawn in a resample
+  indices = rng.integers(0, size, (rounds, size))
+  indices += size * np.arange(rounds)[:, None]
+  return np.bincount(indices.ravel(),
+    minlength=rounds * size).reshape(rounds, size).astype(float)
+
+def _sumsAndCounts(values):
+  # Columns of values with NaN as 0, followed by where values are present
+  present = ~np.isnan(values)
+  return np.hstack([np.where(present, values, 0), present])
+
+def bootstrapMeans(values, rounds = ROUNDS, seed = SEED):
+  """
+  Means of every column of values (workers x columns) in each of `rounds`
+  bootstrap resamples of the workers, skipping NaN. Returns a rounds x columns
+  array.
+  """
+  values = np.asarray(values, dtype=float)
+  if values.ndim == 1:
+    values = values[:, None]
+  size, columns = values.shape
+  means = np.full((rounds, columns), np.nan)
+  if size == 0:
+    return means
+  # Sums and counts of the values drawn come from the same product
+  stacked = _sumsAndCounts(values)
+  rng = np.random.default_rng(seed)
+  for start in range(0, rounds, BLOCK):
+    count = min(BLOCK, rounds - start)
+    totals = bootstrapWeights(rng, size, count) @ stacked
+    with np.errstate(invalid='ignore', divide='ignore'):
+      means[start:start + count] = totals[:, :columns] / totals[:, columns:]
+  return means
+
+def bootstrapInterval(values, level = LEVEL, rounds = ROUNDS, seed = SEED):
+  """
+  Percentile bootstrap interval of the mean of every column of values. Returns
+  (low, high), one value per column, NaN for columns without any value.
+  """
+  means = bootstrapMeans(values, rounds, seed)
+  tail = (1 - level) / 2
+  # Columns with no value at all stay NaN
+  finite = ~np.isnan(means).all(axis=0)
+  low, high = np.full(means.shape[1], np.nan), np.full(means.shape[1], np.nan)
+  if finite.any():
+    low[finite], high[finite] = np.nanquantile(means[:, finite],
+      [tail, 1 - tail], axis=0)
+  return low, high
+
+def permutationLabels(rng, size, groupSize, rounds):
+  # rounds x size matrix, 1 for the groupSize workers relabeled as the first
+  # group in each permutation
+  order = rng.permuted(np.tile(np.arange(size), (rounds, 1)), axis=1)
+  return (order < groupSize).astype(float)
+
+def permutationTest(a, b, rounds = PERMUTATIONS, seed = SEED):
+  """
+  Two-sided label permutation test of the difference in means between two
+  groups of workers, for every column of a and b (workers x columns each),
+  skipping NaN. Whole workers are relabeled, so the columns of a permutation
+  share one split. Returns (difference of means b - a, p-value) per column,
+  both NaN where a group has no value.
+  """
+  a = np.asarray(a, dtype=float).reshape(len(a), -1)
+  b = np.asarray(b, dtype=float).reshape(len(b), -1)
+  columns = a.shape[1]
+  stacked = _sumsAndCounts(np.vstack([a, b]))
+  total = stacked.sum(axis=0)
+
+  def differences(first):
+    # Mean of the rest minus mean of the first group, from its sums and counts
+    rest = total - first
+    with np.errstate(invalid='ignore', divide='ignore'):
+      return rest[..., :columns] / rest[..., columns:] - \
+        first[..., :columns] / first[..., columns:]
+
+  observed = differences(stacked[:len(a)].sum(axis=0))
+  size = len(stacked)
+  if len(a) == 0 or len(b) == 0:
+    return observed, np.full(columns, np.nan)
+  # Tolerance for permutations that tie the observed difference
+  threshold = np.abs(observed) * (1 - 1e-9)
+  extreme, valid = np.zeros(columns), np.zeros(columns)
+  rng = np.random.default_rng(seed)
+  for start in range(0, rounds, BLOCK):
+    count = min(BLOCK, rounds - start)
+    labels = permutationLabels(rng, size, len(a), count)
+    diffs = np.abs(differences(labels @ stacked))
+    extreme += (diffs >= threshold).sum(axis=0)
+    valid += (~np.isnan(diffs)).sum(axis=0)
+  # The observed labels count as one of the permutations
+  with np.errstate(invalid='ignore'):
+    p = np.where(np.isnan(observed), np.nan, (extreme + 1) / (valid + 1))
+  return observed, p
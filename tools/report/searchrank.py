@@ -0,0 +1,182 @@
+"""searchrank
+Port of the Smart Search ranking in crowd-app/src/components/smart/
+search-engine.ts (buildIndex and SimpleSearchEngine with partial matching),
+for replaying logged queries offline. The index build mirrors
+tools/deploy/tools/searchindex, which ships precomputed indexes in configs.
+"""
+import re
+import math
+import bisect
+import numpy as np
+import scipy.sparse as sp
+
+TOKEN_SEPARATOR = re.compile(r'[^a-zA-Z0-9-]+')
+INDEX_MAX_NGRAM = 2
+ABBREV_MAX_NGRAM = 4
+QUERY_MAX_NGRAM = 2
+# Partial prefix matching only kicks in for short query terms
+PARTIAL_MAX_LENGTH = 10
+# Keys that resolve to Object.prototype members in the browser and therefore
+# never get a record of their own
+SHADOWED_KEYS = frozenset(['constructor'])
+
+def tokenize(text):
+  return [t for t in TOKEN_SEPARATOR.split(text) if len(t.strip()) > 0]
+
+def ngramTokens(tokens, maxNgram):
+  for ngram in range(maxNgram, 0, -1):
+    for i in range(0, len(tokens) - ngram + 1):
+      yield tokens[i:i + ngram]
+
+def bodyText(body):
+  # Bodies are either {'id', 't'} spans or compact lists of lines
+  return ' '.join(' '.join(span if isinstance(span, str) else span['t']
+    for span in p) for p in body)
+
+def buildIndex(messages):
+  """
+  Same index as buildIndex in search-engine.ts: the token size of every
+  message and, per key, a list of [documentId, count] records.
+  """
+  index, sizes = {}, []
+  maxNgram = max(INDEX_MAX_NGRAM, ABBREV_MAX_NGRAM)
+  for documentId, message in enumerate(messages):
+    subjectTokens = tokenize(message['subject'] + ' ' +
+      message['from']['fullName'])
+    bodyTokens = tokenize(bodyText(message['body']))
+    sizes.append(len(subjectTokens) * 2 + len(bodyTokens))
+    records = {}
+
+    def add(key, weight):
+      if key in SHADOWED_KEYS:
+        return
+      if not key in records:
+        records[key] = [documentId, 0]
+        index.setdefault(key, []).append(records[key])
+      records[key][1] += weight
+
+    for tokens, weight in ((subjectTokens, 2), (bodyTokens, 1)):
+      for t in ngramTokens(tokens, maxNgram):
+        if len(t) <= INDEX_MAX_NGRAM:
+          add(' '.join(t).lower(), weight)
+        if len(t) <= ABBREV_MAX_NGRAM and len(t) > 1:
+          if t[0][0] == t[0][0].upper() and t[-1][0] == t[-1][0].upper():
+            add(''.join(tok[0] for tok in t).lower(), weight)
+        if len(t) == 1 and t[0] == t[0].upper():
+          add(t[0], weight)
+  return sizes, index
+
+def unpackIndex(packed):
+  # Reads the searchIndex that build_tasks.py --search-index stores in configs
+  postings = packed['postings']
+  return packed['sizes'], {key: [postings[key][i:i + 2]
+    for i in range(0, len(postings[key]), 2)] for key in postings}
+
+class SearchRanker():
+  """
+  Ranks the messages of one search session. Every index key becomes a row of
+  a sparse key x document matrix holding its summed tf-idf contribution, so a
+  batch of queries is scored with a single sparse product.
+  """
+  def __init__(self, messages, augmented = None, searchIndex = None):
+    sizes, index = buildIndex(messages) if searchIndex is None else \
+      unpackIndex(searchIndex)
+    n = len(messages)
+    # Entries of the session's 'index' rank their emails first
+    records = {key: [(d, c / sizes[d], 0) for d, c in recs]
+      for key, recs in index.items()}
+    ids = {}
+    for i, m in enumerate(messages):
+      ids.setdefault(m['id'], i)
+    for keyword, targets in (augmented or {}).items():
+      if len(targets) > 0:
+        records.setdefault(keyword, []).extend(
+          (ids[id], 1, 1) for id in targets if id in ids)
+
+    self.size = n
+    self.keys = {}
+    rows, cols, values = [], [], []
+    for key, recs in records.items():
+      row = self.keys.setdefault(key, len(self.keys))
+      idf = math.log(n / len(recs)) if len(recs) > 0 else 0
+      for d, tf, cheat in recs:
+        rows.append(row)
+        cols.append(d)
+        values.append(tf * idf + cheat)
+    shape = (len(self.keys), n)
+    self.weights = sp.csr_matrix((values, (rows, cols)), shape=shape)
+    self.present = sp.csr_matrix(
+      (np.ones(len(rows)), (rows, cols)), shape=shape)
+    self.present.data[:] = 1
+    self._prefixes = sorted((key.lower(), row) for key, row in self.keys.items())
+    self._terms = {}
+
+  def _matchKeys(self, terms):
+    standardKey = ' '.join(terms)
+    if standardKey in self.keys:
+      return [self.keys[standardKey]]
+    if standardKey.lower() in self.keys:
+      return [self.keys[standardKey.lower()]]
+    if len(standardKey) >= PARTIAL_MAX_LENGTH:
+      return []
+    prefix, rows = standardKey.lower(), []
+    i = bisect.bisect_left(self._prefixes, (prefix, -1))
+    while i < len(self._prefixes) and self._prefixes[i][0].startswith(prefix):
+      rows.append(self._prefixes[i][1])
+      i += 1
+    return rows
+
+  def queryTerms(self, query):
+    """
+    Index rows a query touches with their n-gram multipliers, or None when the
+    query has no tokens and the app would not search at all.
+    """
+    if not query in self._terms:
+      normalized = tokenize(query.strip())
+      if len(normalized) == 0:
+        self._terms[query] = None
+      else:
+        terms = {}
+        for t in ngramTokens(normalized, QUERY_MAX_NGRAM):
+          for row in self._matchKeys(t):
+            terms[row] = terms.get(row, 0) + 3 ** (len(t) - 1)
+        self._terms[query] = terms
+    return self._terms[query]
+
+  def score(self, queries):
+    """
+    Scores queries against every message. Returns the score matrix and the
+    matrix of messages each query returns at all (queries x messages).
+    """
+    rows, cols, values = [], [], []
+    for i, query in enumerate(queries):
+      for row, weight in (self.queryTerms(query) or {}).items():
+        rows.append(i)
+        cols.append(row)
+        values.append(weight)
+    q = sp.csr_matrix((values, (rows, cols)),
+      shape=(len(queries), len(self.keys)))
+    scores = np.asarray((q @ self.weights).todense())
+    hits = np.asarray((q @ self.present).todense()) > 0
+    return scores, hits
+
+  def search(self, query):
+    # Result order of SimpleSearchEngine.search for a single query
+    scores, hits = self.score([query])
+    results = np.flatnonzero(hits[0])
+    return results[np.argsort(-scores[0][results], kind='stable')].tolist()
+
+  def ranks(self, queries, targets):
+    """
+    1-based rank of each target message for each query (queries x targets),
+    inf where the query does not return it. Ties keep message order, as the
+    stable sort in the app does.
+    """
+    scores, hits = self.score(queries)
+    order = np.arange(self.size)
+    ranks = np.full((len(queries), len(targets)), np.inf)
+    for j, t in enumerate(targets):
+      s = scores[:, t:t + 1]
+      ahead = hits & ((scores > s) | ((scores == s) & (order < t)))
+      ranks[:, j] = np.where(hits[:, t], ahead.sum(axis=1) + 1, np.inf)
+    return ranks